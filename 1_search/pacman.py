@@ -43,6 +43,8 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
+from game import Grid, ArrayGrid
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -98,8 +100,9 @@ class GameState:
         # Check that successors exist
         if self.isWin() or self.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
 
-        # Copy current state
+        # Copy current state; only the moving agent gets a new AgentState
         state = GameState(self)
+        state.data.copyAgentState( agentIndex )
 
         # Let agent's logic deal with its action's effects on the board
         if agentIndex == 0:  # Pacman is moving
@@ -120,6 +123,7 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
+        state.data.updateHash( self.data )
         GameState.explored.add(self)
         GameState.explored.add(state)
         return state
@@ -231,6 +235,21 @@ class GameState:
         state.data = self.data.deepCopy()
         return state
 
+    def readOnlyView( self ):
+        """
+        Returns a copy of this state that shares its food, capsules and agent
+        states with it instead of copying them like deepCopy does, and keeps
+        the same record of the last move.  It costs next to nothing, but it
+        must not be modified in place.
+        """
+        state = GameState( self )
+        data = state.data
+        data._agentMoved = self.data._agentMoved
+        data._foodEaten = self.data._foodEaten
+        data._foodAdded = self.data._foodAdded
+        data._capsuleEaten = self.data._capsuleEaten
+        return state
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
@@ -271,11 +290,11 @@ class ClassicGameRules:
     def __init__(self, timeout=30):
         self.timeout = timeout
 
-    def newGame( self, layout, pacmanAgent, ghostAgents, display, quiet = False, catchExceptions=False):
+    def newGame( self, layout, pacmanAgent, ghostAgents, display, quiet = False, catchExceptions=False, headless=False):
         agents = [pacmanAgent] + ghostAgents[:layout.getNumGhosts()]
         initState = GameState()
         initState.initialize( layout, len(ghostAgents) )
-        game = Game(agents, display, self, catchExceptions=catchExceptions)
+        game = Game(agents, display, self, catchExceptions=catchExceptions, headless=headless)
         game.state = initState
         self.initialState = initState.deepCopy()
         self.quiet = quiet
@@ -361,8 +380,7 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.food = state.data.food.copyWithCell( x, y, False )
             state.data._foodEaten = position
             # TODO: cache numFood?
             numFood = state.getNumFood()
@@ -371,11 +389,11 @@ class PacmanRules:
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
+            state.data.capsules = [c for c in state.data.capsules if c != position]
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.copyAgentState( index ).scaredTimer = SCARED_TIME
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -414,7 +432,8 @@ class GhostRules:
     def decrementTimer( ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+            conf = ghostState.configuration
+            ghostState.configuration = Configuration( nearestPoint( conf.pos ), conf.direction )
         ghostState.scaredTimer = max( 0, timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
@@ -436,9 +455,11 @@ class GhostRules:
     def collide( state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
+            ghostState = state.data.copyAgentState( agentIndex )
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -523,6 +544,13 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--parallel', dest='parallel', type='int',
+                      help=default('Play the games in N worker processes, without graphics'), metavar='N', default=0)
+    parser.add_option('--arrayGrid', action='store_true', dest='arrayGrid',
+                      help='Store the walls and food in bytearray-backed grids (game.ArrayGrid)', default=False)
+    parser.add_option('--distanceDir', dest='distanceDir', metavar='DIR',
+                      help='Memory-map the maze distance table of the layout from DIR, writing it there first if missing (see layout.py)',
+                      default=None)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -533,7 +561,9 @@ def readCommand( argv ):
     if options.fixRandomSeed: random.seed('cs188')
 
     # Choose a layout
-    args['layout'] = layout.getLayout( options.layout )
+    gridClass = Grid
+    if options.arrayGrid: gridClass = ArrayGrid
+    args['layout'] = layout.getLayout( options.layout, distanceDir = options.distanceDir, gridClass = gridClass )
     if args['layout'] == None: raise Exception("The layout " + options.layout + " cannot be found")
 
     # Choose a Pacman agent
@@ -570,6 +600,7 @@ def readCommand( argv ):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['parallel'] = options.parallel
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
@@ -625,10 +656,14 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
-    import __main__
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, parallel=0 ):
+    import __main__, textDisplay
     __main__.__dict__['_display'] = display
 
+    if parallel > 0:
+        return runGamesInParallel( layout, pacman, ghosts, numGames, record, numTraining,
+                                   catchExceptions, timeout, parallel )
+
     rules = ClassicGameRules(timeout)
     games = []
 
@@ -636,35 +671,96 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
         beQuiet = i < numTraining
         if beQuiet:
                 # Suppress output and graphics
-            import textDisplay
             gameDisplay = textDisplay.NullGraphics()
             rules.quiet = True
         else:
             gameDisplay = display
             rules.quiet = False
-        game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
+        headless = isinstance(gameDisplay, textDisplay.NullGraphics)
+        game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions, headless)
         game.run()
         if not beQuiet: games.append(game)
 
-        if record:
-            import time, cPickle
-            fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-            f = file(fname, 'w')
-            components = {'layout': layout, 'actions': game.moveHistory}
-            cPickle.dump(components, f)
-            f.close()
+        if record: recordGame( layout, game.moveHistory, i )
 
     if (numGames-numTraining) > 0:
-        scores = [game.state.getScore() for game in games]
-        wins = [game.state.isWin() for game in games]
-        winRate = wins.count(True)/ float(len(wins))
-        print 'Average Score:', sum(scores) / float(len(scores))
-        print 'Scores:       ', ', '.join([str(score) for score in scores])
-        print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
-        print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
+        printSummary( [game.state.getScore() for game in games], [game.state.isWin() for game in games] )
 
     return games
 
+def recordGame( layout, moveHistory, i ):
+    import time, cPickle
+    fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
+    f = file(fname, 'w')
+    components = {'layout': layout, 'actions': moveHistory}
+    cPickle.dump(components, f)
+    f.close()
+
+def printSummary( scores, wins ):
+    winRate = wins.count(True)/ float(len(wins))
+    print 'Average Score:', sum(scores) / float(len(scores))
+    print 'Scores:       ', ', '.join([str(score) for score in scores])
+    print 'Win Rate:      %d/%d (%.2f)' % (wins.count(True), len(wins), winRate)
+    print 'Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins])
+
+def runGamesInParallel( layout, pacman, ghosts, numGames, record, numTraining, catchExceptions, timeout, parallel ):
+    """
+    Plays the games of runGames in parallel worker processes, without graphics,
+    printing each result as it comes in and the usual summary at the end.
+
+    Every game is played by a fresh worker forked from this process, with its
+    own seed drawn from the random module, so a run with --fixRandomSeed plays
+    the same games whatever order they finish in.  Returns a finished Game for
+    each game, as runGames does, holding the final state and move history the
+    worker sent back.
+    """
+    if numTraining > 0:
+        raise Exception('Training games cannot be played in parallel: the agent learns from one game to the next')
+    import multiprocessing, textDisplay
+    seeds = [random.getrandbits(32) for i in range( numGames )]
+    pool = multiprocessing.Pool(parallel, initGameWorker, (layout, pacman, ghosts, catchExceptions, timeout),
+                                maxtasksperchild=1)
+    rules = ClassicGameRules(timeout)
+    games = [None] * numGames
+    try:
+        for i, state, moveHistory in pool.imap_unordered(playGame, enumerate(seeds)):
+            game = rules.newGame( layout, pacman, ghosts, textDisplay.NullGraphics(), True, catchExceptions, True )
+            game.state = state
+            game.moveHistory = moveHistory
+            game.gameOver = True
+            games[i] = game
+            print 'Game %d: %s, score %s (%d/%d done)' % \
+                (i + 1, ['Loss', 'Win'][int(state.isWin())], state.getScore(), numGames - games.count(None), numGames)
+            if record: recordGame( layout, moveHistory, i )
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    pool.join()
+
+    if numGames > 0:
+        printSummary( [game.state.getScore() for game in games], [game.state.isWin() for game in games] )
+
+    return games
+
+# What the games played by a worker process share, set up by initGameWorker
+GAME_WORKER = {}
+
+def initGameWorker( layout, pacman, ghosts, catchExceptions, timeout ):
+    GAME_WORKER.update(layout=layout, pacman=pacman, ghosts=ghosts,
+                       catchExceptions=catchExceptions, timeout=timeout)
+
+def playGame( task ):
+    "Plays game number i of runGamesInParallel in a worker process"
+    import textDisplay
+    i, seed = task
+    random.seed(seed)
+    rules = ClassicGameRules(GAME_WORKER['timeout'])
+    game = rules.newGame( GAME_WORKER['layout'], GAME_WORKER['pacman'], GAME_WORKER['ghosts'],
+                          textDisplay.NullGraphics(), True, GAME_WORKER['catchExceptions'], True )
+    game.run()
+    return i, game.state, game.moveHistory
+
 if __name__ == '__main__':
     """
     The main function called when pacman.py is run
@@ -73,41 +73,54 @@ def tinyMazeSearch(problem):
     return  [s, s, w, s, w, w, s, w]
 
 
-class Path(object):
-    """Representation of potential search paths"""
-    def __init__(self, nodes, actions=[], cost=0, future_cost=0):
-        self.nodes = nodes
-        self.actions = actions
+class SearchNode(object):
+    """
+    A node in the search tree.  Rather than copying the whole path on every
+    push, each node only links back to its parent; the list of actions is
+    rebuilt once, when the goal is reached.
+    """
+    __slots__ = ('state', 'action', 'cost', 'future_cost', 'parent')
+
+    def __init__(self, state, action=None, cost=0, future_cost=0, parent=None):
+        self.state = state
+        self.action = action
         self.cost = cost
         self.future_cost = future_cost
+        self.parent = parent
+
+    def getActions(self):
+        "Returns the list of actions leading from the root to this node"
+        actions = []
+        node = self
+        while node.parent is not None:
+            actions.append(node.action)
+            node = node.parent
+        actions.reverse()
+        return actions
 
     def __str__(self):
-        return '(%s, %s, %i)' % (self.nodes, self.actions, self.cost)
+        return '(%s, %s, %i)' % (self.state, self.action, self.cost)
 
     def __repr__(self):
         return self.__str__()
 
 def graphSearch(problem, container, heuristic):
-    paths = container
-    start_path = Path([problem.getStartState()])
-    paths.push(start_path)
+    nodes = container
+    nodes.push(SearchNode(problem.getStartState()))
     visited = set()
 
-    while not paths.isEmpty():
-        path = paths.pop()
-        last_node = path.nodes[-1]
-        if problem.isGoalState(last_node):
+    while not nodes.isEmpty():
+        node = nodes.pop()
+        state = node.state
+        if problem.isGoalState(state):
             break
-        if last_node not in visited:
-            visited.add(last_node)
-            for neighbor, action, cost in problem.getSuccessors(last_node):
-                new_path = Path(path.nodes + [neighbor], \
-                                path.actions + [action], \
-                                path.cost + cost, \
-                                heuristic(neighbor, problem))
-                paths.push(new_path)
+        if state not in visited:
+            visited.add(state)
+            for neighbor, action, cost in problem.getSuccessors(state):
+                nodes.push(SearchNode(neighbor, action, node.cost + cost,
+                                      heuristic(neighbor, problem), node))
 
-    return path.actions
+    return node.getActions()
 
 def depthFirstSearch(problem):
     """
@@ -129,9 +142,15 @@ def breadthFirstSearch(problem):
     """Search the shallowest nodes in the search tree first."""
     return graphSearch(problem, util.Queue(), nullHeuristic)
 
-def uniformCostSearch(problem):
-    """Search the node of least total cost first."""
-    container = util.PriorityQueueWithFunction(lambda path : path.cost)
+def uniformCostSearch(problem, indexed=False):
+    """
+    Search the node of least total cost first.
+
+    With indexed=True, uses the decrease-key frontier of bestFirstSearch.
+    """
+    if indexed:
+        return bestFirstSearch(problem, nullHeuristic)
+    container = util.PriorityQueueWithFunction(lambda node : node.cost)
     return graphSearch(problem, container, nullHeuristic)
 
 def nullHeuristic(state, problem=None):
@@ -141,14 +160,70 @@ def nullHeuristic(state, problem=None):
     """
     return 0
 
-def aStarSearch(problem, heuristic=nullHeuristic):
-    """Search the node that has the lowest combined cost and heuristic first."""
-    container = util.PriorityQueueWithFunction(lambda path : path.cost \
-    + path.future_cost)
+def aStarSearch(problem, heuristic=nullHeuristic, indexed=False):
+    """
+    Search the node that has the lowest combined cost and heuristic first.
+
+    With indexed=True, uses the decrease-key frontier of bestFirstSearch.
+    """
+    if indexed:
+        return bestFirstSearch(problem, heuristic)
+    container = util.PriorityQueueWithFunction(lambda node : node.cost \
+    + node.future_cost)
     return graphSearch(problem, container, heuristic)
 
+def bestFirstSearch(problem, heuristic=nullHeuristic, lazy=False):
+    """
+    Best-first graph search on an IndexedPriorityQueue.  A table of the best
+    cost found so far for every state keeps each state in the frontier at
+    most once: finding a cheaper path to a queued state lowers its priority
+    in place instead of pushing a duplicate.  With lazy=True the queue falls
+    back to lazy deletion, leaving stale entries to be skipped on pop.
+
+    The peak frontier size and the number of stale pops are left on the
+    problem as frontierPeakSize and frontierStalePops.
+    """
+    start = problem.getStartState()
+    frontier = util.IndexedPriorityQueue(lazy)
+    frontier.push(start, SearchNode(start), heuristic(start, problem))
+    bestCost = {start: 0}
+    closed = set()
+    actions = []
+
+    while not frontier.isEmpty():
+        node = frontier.pop()
+        state = node.state
+        if problem.isGoalState(state):
+            actions = node.getActions()
+            break
+        closed.add(state)
+        for neighbor, action, cost in problem.getSuccessors(state):
+            if neighbor in closed:
+                continue
+            g = node.cost + cost
+            if neighbor in bestCost and bestCost[neighbor] <= g:
+                continue
+            bestCost[neighbor] = g
+            h = heuristic(neighbor, problem)
+            frontier.push(neighbor, SearchNode(neighbor, action, g, h, node),
+                          g + h)
+
+    problem.frontierPeakSize = frontier.peakSize
+    problem.frontierStalePops = frontier.stalePops
+    return actions
+
+def indexedUniformCostSearch(problem):
+    """Uniform cost search on a decrease-key frontier."""
+    return uniformCostSearch(problem, indexed=True)
+
+def indexedAStarSearch(problem, heuristic=nullHeuristic):
+    """A* search on a decrease-key frontier."""
+    return aStarSearch(problem, heuristic, indexed=True)
+
 # Abbreviations
 bfs = breadthFirstSearch
 dfs = depthFirstSearch
 astar = aStarSearch
 ucs = uniformCostSearch
+iastar = indexedAStarSearch
+iucs = indexedUniformCostSearch
@@ -206,6 +206,126 @@ class PriorityQueue:
         else:
             self.push(item, priority)
 
+class IndexedPriorityQueue:
+    """
+      A priority queue in which every item is filed under a key (usually a
+      search state), so each key is in the queue at most once.  Pushing a
+      key that is already queued with a lower priority is a decrease-key
+      operation that takes O(log n) instead of the linear scan and heapify
+      done by PriorityQueue.update.
+
+      With lazy=True, decrease-key instead pushes a fresh entry and marks
+      the old one as stale; stale entries are discarded when they reach the
+      top of the heap.
+
+      peakSize and stalePops record the largest heap size seen and the
+      number of stale entries popped, for comparing the two modes.
+    """
+    # Heap entries are lists [priority, count, position, live, key, item];
+    # the unique count breaks ties so keys and items are never compared.
+
+    def  __init__(self, lazy=False):
+        self.heap = []
+        self.index = {}
+        self.count = 0
+        self.lazy = lazy
+        self.peakSize = 0
+        self.stalePops = 0
+
+    def push(self, key, item, priority):
+        """
+          Queues item under key.  If key is already queued with a priority
+          lower than or equal to priority, nothing happens.  Returns True
+          if the queue was changed.
+        """
+        entry = self.index.get(key)
+        if entry is not None:
+            if entry[0] <= priority:
+                return False
+            if not self.lazy:
+                entry[0] = priority
+                entry[1] = self.count
+                entry[5] = item
+                self.count += 1
+                self._siftUp(entry[2])
+                return True
+            entry[3] = False
+        entry = [priority, self.count, len(self.heap), True, key, item]
+        self.count += 1
+        self.index[key] = entry
+        if self.lazy:
+            heapq.heappush(self.heap, entry)
+        else:
+            self.heap.append(entry)
+            self._siftUp(entry[2])
+        if len(self.heap) > self.peakSize:
+            self.peakSize = len(self.heap)
+        return True
+
+    def pop(self):
+        "Removes and returns the item with the lowest priority"
+        if self.lazy:
+            self._dropStale()
+            entry = heapq.heappop(self.heap)
+        else:
+            entry = self.heap[0]
+            last = self.heap.pop()
+            if self.heap:
+                self.heap[0] = last
+                self._siftDown(0)
+        del self.index[entry[4]]
+        return entry[5]
+
+    def isEmpty(self):
+        if self.lazy:
+            self._dropStale()
+        return len(self.heap) == 0
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def _dropStale(self):
+        heap = self.heap
+        while heap and not heap[0][3]:
+            heapq.heappop(heap)
+            self.stalePops += 1
+
+    def _siftUp(self, pos):
+        heap = self.heap
+        entry = heap[pos]
+        while pos > 0:
+            parentPos = (pos - 1) >> 1
+            parent = heap[parentPos]
+            if parent[:2] <= entry[:2]:
+                break
+            heap[pos] = parent
+            parent[2] = pos
+            pos = parentPos
+        heap[pos] = entry
+        entry[2] = pos
+
+    def _siftDown(self, pos):
+        heap = self.heap
+        size = len(heap)
+        entry = heap[pos]
+        childPos = 2 * pos + 1
+        while childPos < size:
+            rightPos = childPos + 1
+            if rightPos < size and heap[rightPos][:2] < heap[childPos][:2]:
+                childPos = rightPos
+            child = heap[childPos]
+            if entry[:2] <= child[:2]:
+                break
+            heap[pos] = child
+            child[2] = pos
+            pos = childPos
+            childPos = 2 * pos + 1
+        heap[pos] = entry
+        entry[2] = pos
+
 class PriorityQueueWithFunction(PriorityQueue):
     """
     Implements a priority queue with the same push/pop signature of the
@@ -22,8 +22,13 @@
 
 from util import *
 import time, os
+import copy
+import random
 import traceback
 import sys
+import string
+import struct
+import binascii
 
 #######################
 # Parts worth reading #
@@ -166,7 +171,13 @@ class Grid:
     y vertical and the origin (0,0) in the bottom left corner.
 
     The __str__ method constructs an output that is oriented like a pacman board.
+
+    The walls of a Layout also carry the MoveTable of the maze in moveTable.
     """
+    moveTable = None
+    TO_DIGITS = string.maketrans('\x00\x01', '01')
+    FROM_DIGITS = string.maketrans('01', '\x00\x01')
+
     def __init__(self, width, height, initialValue=False, bitRepresentation=None):
         if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
         self.CELLS_PER_INT = 30
@@ -190,18 +201,19 @@ class Grid:
 
     def __eq__(self, other):
         if other == None: return False
+        if other.__class__ is not self.__class__:
+            # e.g. a Grid and an ArrayGrid: compare the cells, not the columns
+            return (self.width, self.height) == (other.width, other.height) and \
+                self.asList() == other.asList()
         return self.data == other.data
 
+    def __ne__(self, other):
+        return not self == other
+
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        # The cells as the bits of one integer, cell x * height + y in bit x * height + y
+        digits = self._digits()[::-1]
+        return hash(int(digits, 2) if digits else 0)
 
     def copy(self):
         g = Grid(self.width, self.height)
@@ -216,6 +228,19 @@ class Grid:
         g.data = self.data
         return g
 
+    def copyWithCell(self, x, y, value):
+        """
+        Returns a copy of the grid with (x,y) set to value.  Only column x is
+        copied; the other columns are shared with this grid, so neither grid
+        may be modified in place afterwards.
+        """
+        g = copy.copy(self)
+        g.data = self.data[:]
+        column = self.data[x][:]
+        column[y] = value
+        g.data[x] = column
+        return g
+
     def count(self, item =True ):
         return sum([x.count(item) for x in self.data])
 
@@ -226,60 +251,255 @@ class Grid:
                 if self[x][y] == key: list.append( (x,y) )
         return list
 
+    def _digits(self):
+        "The cells as a string of '0' and '1' in cell index order (x * height + y)"
+        return ''.join([str(bytearray(column)) for column in self.data]).translate(self.TO_DIGITS)
+
+    def _setDigits(self, digits):
+        "Fills in data from a string of '0' and '1' in cell index order"
+        cells = bytearray(digits[:self.width * self.height].translate(self.FROM_DIGITS))
+        height = self.height
+        for x in range(self.width):
+            column = cells[x * height:(x + 1) * height]
+            self.data[x][:len(column)] = map(bool, column)
+
     def packBits(self):
         """
         Returns an efficient int list representation
 
         (width, height, bitPackedInts...)
+
+        Each int holds CELLS_PER_INT cells, the first of them in its highest bit.
         """
-        bits = [self.width, self.height]
-        currentInt = 0
-        for i in range(self.height * self.width):
-            bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
-                currentInt += 2 ** bit
-            if (i + 1) % self.CELLS_PER_INT == 0:
-                bits.append(currentInt)
-                currentInt = 0
-        bits.append(currentInt)
-        return tuple(bits)
-
-    def _cellIndexToPosition(self, index):
-        x = index / self.height
-        y = index % self.height
-        return x, y
+        digits = self._digits()
+        size = self.CELLS_PER_INT
+        full = len(digits) - len(digits) % size
+        ints = [int(digits[i:i + size], 2) for i in range(0, full, size)]
+        ints.append(int(digits[full:].ljust(size, '0'), 2))
+        return tuple([self.width, self.height] + ints)
 
     def _unpackBits(self, bits):
         """
         Fills in data from a bit-level representation
         """
-        cell = 0
-        for packed in bits:
-            for bit in self._unpackInt(packed, self.CELLS_PER_INT):
-                if cell == self.width * self.height: break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
-                cell += 1
+        size = self.CELLS_PER_INT
+        self._setDigits(''.join([self._unpackInt(packed, size) for packed in bits]))
 
     def _unpackInt(self, packed, size):
-        bools = []
+        "The low size bits of packed as '0' and '1' digits, highest bit first"
         if packed < 0: raise ValueError, "must be a positive integer"
-        for i in range(size):
-            n = 2 ** (self.CELLS_PER_INT - i - 1)
-            if packed >= n:
-                bools.append(True)
-                packed -= n
-            else:
-                bools.append(False)
-        return bools
+        return bin(packed & ((1 << size) - 1))[2:].zfill(size)
+
+    def toBytes(self):
+        """
+        Returns the grid in the versioned binary format read by gridFromBytes:
+
+        (version, width, height) packed as GRID_HEADER, followed by the cells
+        as a little-endian integer with cell x * height + y in bit x * height + y.
+
+        Smaller and quicker to build than packBits, this is the format used to
+        ship states between worker processes.
+        """
+        digits = self._digits()[::-1]
+        cells = ''
+        if digits:
+            numBytes = (len(digits) + 7) / 8
+            cells = binascii.unhexlify(('%x' % int(digits, 2)).zfill(2 * numBytes))[::-1]
+        return struct.pack(GRID_HEADER, GRID_FORMAT_VERSION, self.width, self.height) + cells
+
+class ArrayGrid(Grid):
+    """
+    A Grid that stores each column as a bytearray of 0s and 1s instead of
+    a list of booleans.  grid[x][y] reads and writes as before (cells read
+    back as 0 and 1), but counting, listing, comparing, hashing, copying
+    and bit packing are done by bytearray and string methods over whole
+    columns rather than by Python loops over cells.
+
+    Use it for the food and walls of a layout with Layout(text, ArrayGrid)
+    or getLayout(name, gridClass=ArrayGrid).
+    """
+    def __init__(self, width, height, initialValue=False, bitRepresentation=None):
+        if initialValue not in [False, True]: raise Exception('Grids can only contain booleans')
+        self.CELLS_PER_INT = 30
+
+        self.width = width
+        self.height = height
+        self.data = [bytearray([initialValue]) * height for x in range(width)]
+        if bitRepresentation:
+            self._unpackBits(bitRepresentation)
+
+    def __str__(self):
+        out = [['FT'[self.data[x][y]] for x in range(self.width)] for y in range(self.height)]
+        out.reverse()
+        return '\n'.join([''.join(x) for x in out])
+
+    def _digits(self):
+        "The cells as a string of '0' and '1' in cell index order"
+        return ''.join([str(column) for column in self.data]).translate(self.TO_DIGITS)
+
+    def _setDigits(self, digits):
+        "Fills in data from a string of '0' and '1' in cell index order"
+        cells = bytearray(digits[:self.width * self.height].translate(self.FROM_DIGITS))
+        height = self.height
+        for x in range(self.width):
+            column = cells[x * height:(x + 1) * height]
+            self.data[x][:len(column)] = column
+
+    def copy(self):
+        g = ArrayGrid(self.width, self.height)
+        g.data = [column[:] for column in self.data]
+        return g
+
+    def deepCopy(self):
+        return self.copy()
+
+    def shallowCopy(self):
+        g = ArrayGrid(self.width, self.height)
+        g.data = self.data
+        return g
+
+    def count(self, item =True ):
+        cell = '\x01' if item else '\x00'
+        return sum([column.count(cell) for column in self.data])
+
+    def asList(self, key = True):
+        cell = '\x01' if key else '\x00'
+        list = []
+        for x, column in enumerate(self.data):
+            y = column.find(cell)
+            while y >= 0:
+                list.append( (x,y) )
+                y = column.find(cell, y + 1)
+        return list
+
+GRID_HEADER = '<BHH'
+GRID_FORMAT_VERSION = 1
+
+def gridFromBytes(data, gridClass=Grid):
+    "Rebuilds a grid written by Grid.toBytes"
+    version, width, height = struct.unpack(GRID_HEADER, data[:struct.calcsize(GRID_HEADER)])
+    if version != GRID_FORMAT_VERSION:
+        raise ValueError, "unknown grid format version %d" % version
+    cells = data[struct.calcsize(GRID_HEADER):][::-1]
+    packed = int(binascii.hexlify(cells), 16) if cells else 0
+    grid = gridClass(width, height)
+    grid._setDigits(bin(packed)[2:].zfill(width * height)[::-1])
+    return grid
 
 def reconstituteGrid(bitRep):
+    "Rebuilds a grid from packBits or toBytes output; anything else is returned as is"
+    if type(bitRep) is type(''):
+        return gridFromBytes(bitRep)
     if type(bitRep) is not type((1,2)):
         return bitRep
     width, height = bitRep[:2]
     return Grid(width, height, bitRepresentation= bitRep[2:])
 
+class BitGrid(object):
+    """
+    An immutable boolean grid packed into a single integer, with the cell
+    (x,y) stored in bit x * height + y.  Hashing, comparison and clearing a
+    cell work on that one integer instead of walking a list of lists, which
+    makes BitGrids cheap to use inside search states.
+
+    Cells are read with grid[x][y] or grid.get(x, y) like a Grid; use
+    without(x, y) to get a copy with a cell cleared.
+    """
+    __slots__ = ('width', 'height', 'bits', '_count', '_hash')
+
+    def __init__(self, width, height, bits=0, count=None):
+        self.width = width
+        self.height = height
+        self.bits = bits
+        if count is None:
+            count = bin(bits).count('1')
+        self._count = count
+        self._hash = None
+
+    def fromGrid(grid):
+        "Packs the True cells of a Grid into a BitGrid"
+        bits = 0
+        count = 0
+        cell = 1
+        for column in grid.data:
+            for value in column:
+                if value:
+                    bits |= cell
+                    count += 1
+                cell <<= 1
+        return BitGrid(grid.width, grid.height, bits, count)
+    fromGrid = staticmethod(fromGrid)
+
+    def get(self, x, y):
+        return (self.bits >> (x * self.height + y)) & 1 == 1
+
+    def __getitem__(self, x):
+        return _BitGridColumn(self, x)
+
+    def without(self, x, y):
+        "Returns a BitGrid with (x,y) cleared; self if it was already clear"
+        cell = 1 << (x * self.height + y)
+        if not self.bits & cell:
+            return self
+        return BitGrid(self.width, self.height, self.bits ^ cell, self._count - 1)
+
+    def count(self, item=True):
+        if item:
+            return self._count
+        return self.width * self.height - self._count
+
+    def asList(self, key=True):
+        if not key:
+            return self.toGrid().asList(False)
+        list = []
+        height = self.height
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            list.append((index // height, index % height))
+            bits ^= low
+        return list
+
+    def toGrid(self):
+        g = Grid(self.width, self.height)
+        for x, y in self.asList():
+            g.data[x][y] = True
+        return g
+
+    def copy(self):
+        return self
+
+    def deepCopy(self):
+        return self
+
+    def __eq__(self, other):
+        if not isinstance(other, BitGrid): return False
+        return self.bits == other.bits and self.height == other.height \
+            and self.width == other.width
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self.bits)
+        return self._hash
+
+    def __str__(self):
+        return str(self.toGrid())
+
+class _BitGridColumn(object):
+    "Read-only view of one column of a BitGrid, for grid[x][y] access"
+    __slots__ = ('grid', 'x')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __getitem__(self, y):
+        return self.grid.get(self.x, y)
+
 ####################################
 # Parts you shouldn't have to read #
 ####################################
@@ -330,6 +550,13 @@ class Actions:
     directionToVector = staticmethod(directionToVector)
 
     def getPossibleActions(config, walls):
+        # Agents on a cell of a maze with a MoveTable are looked up there
+        table = getattr(walls, 'moveTable', None)
+        if table != None:
+            actions = table.possibleActions.get(config.pos)
+            if actions != None:
+                return list(actions)
+
         possible = []
         x, y = config.pos
         x_int, y_int = int(x + 0.5), int(y + 0.5)
@@ -349,6 +576,12 @@ class Actions:
     getPossibleActions = staticmethod(getPossibleActions)
 
     def getLegalNeighbors(position, walls):
+        table = getattr(walls, 'moveTable', None)
+        if table != None:
+            neighbors = table.neighbors.get(position)
+            if neighbors != None:
+                return list(neighbors)
+
         x,y = position
         x_int, y_int = int(x + 0.5), int(y + 0.5)
         neighbors = []
@@ -368,21 +601,107 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
+class MoveTable:
+    """
+    The legal moves from every open cell of a maze, computed once per maze
+    (Layouts with the same text share one table): the directions that do
+    not run into a wall and the neighboring cells (as
+    Actions.getLegalNeighbors) keyed by cell.  Agents between cells are not
+    in the table, and Actions falls back to probing the walls for them.
+    """
+    def __init__(self, walls):
+        self.possibleActions = {}
+        self.neighbors = {}
+        for x in range(walls.width):
+            for y in range(walls.height):
+                if walls[x][y]: continue
+                position = (x, y)
+                self.neighbors[position] = tuple(Actions.getLegalNeighbors(position, walls))
+                try:
+                    actions = Actions.getPossibleActions(Configuration(position, Directions.STOP), walls)
+                except IndexError:
+                    # Open on the border: leave it to the slow path, which fails the same way
+                    continue
+                self.possibleActions[position] = tuple(actions)
+
+class ZobristKeys:
+    """
+    Random keys for Zobrist hashing of the game states of one layout: one key
+    per (agent, half-cell position), (agent, direction) and (agent, scared
+    timer), and one per cell for food and capsules.  A state's hash is the
+    XOR of the keys of its features, so a successor's hash can be derived
+    from its parent's by XOR-ing out the features that changed and XOR-ing
+    in their replacements.
+
+    The keys are drawn from a generator seeded with the layout text, so the
+    hashes are the same in every process.
+    """
+    TIMER_KEYS = 64
+
+    def __init__(self, layout):
+        rng = random.Random(hash('\n'.join(layout.layoutText)))
+        def keyGrid(width, height):
+            return [[rng.getrandbits(63) for y in range(height)] for x in range(width)]
+        width, height = layout.width, layout.height
+        numAgents = len(layout.agentPositions)
+        self.food = keyGrid(width, height)
+        self.capsules = keyGrid(width, height)
+        self.positions = [keyGrid(2 * width, 2 * height) for i in range(numAgents)]
+        self.directions = [dict([(d, rng.getrandbits(63)) for d in sorted(Actions._directions)])
+                           for i in range(numAgents)]
+        self.timers = [[rng.getrandbits(63) for t in range(self.TIMER_KEYS)]
+                       for i in range(numAgents)]
+
+    def agentKey(self, index, agentState):
+        key = self.timers[index][agentState.scaredTimer % self.TIMER_KEYS]
+        conf = agentState.configuration
+        if conf != None:
+            x, y = conf.pos
+            key ^= self.positions[index][int(x * 2)][int(y * 2)]
+            key ^= self.directions[index][conf.direction]
+        return key
+
+    def stateKey(self, data):
+        "Computes the key of a GameStateData from scratch"
+        key = 0
+        for index, agentState in enumerate(data.agentStates):
+            key ^= self.agentKey(index, agentState)
+        for x, y in data.food.asList():
+            key ^= self.food[x][y]
+        for x, y in data.capsules:
+            key ^= self.capsules[x][y]
+        return key
+
+ZOBRIST_KEYS_CACHE = {}
+
+def getZobristKeys(layout):
+    "Returns the ZobristKeys of a layout, shared by all layouts with its text"
+    text = '\n'.join(layout.layoutText)
+    if text not in ZOBRIST_KEYS_CACHE:
+        ZOBRIST_KEYS_CACHE[text] = ZobristKeys(layout)
+    return ZOBRIST_KEYS_CACHE[text]
+
 class GameStateData:
     """
 
     """
     def __init__( self, prevState = None ):
         """
-        Generates a new data packet by copying information from its predecessor.
+        Generates a new data packet from its predecessor.
+
+        The food grid, capsule list and agent states are shared with the
+        predecessor rather than copied: code that changes the successor must
+        replace them (see copyAgentState) instead of modifying them in place.
         """
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            self.zobristKeys = prevState.zobristKeys
+            self._zobrist = prevState._zobrist
 
         self._foodEaten = None
         self._foodAdded = None
@@ -391,10 +710,16 @@ class GameStateData:
         self._lose = False
         self._win = False
         self.scoreChange = 0
+        if prevState == None:
+            self.zobristKeys = None
+            self._zobrist = None
 
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates( self.agentStates )
+        state._eaten = self._eaten[:]
         state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
@@ -402,12 +727,44 @@ class GameStateData:
         state._capsuleEaten = self._capsuleEaten
         return state
 
+    def updateHash( self, prevState ):
+        """
+        Derives the Zobrist key of this state from that of prevState, the
+        GameStateData it was generated from: only the agent states that were
+        replaced and the food or capsule just eaten are XOR-ed in or out.
+        """
+        keys = self.zobristKeys
+        key = prevState._zobrist
+        if keys == None or key == None:
+            self._zobrist = None
+            return
+        oldStates = prevState.agentStates
+        for index, agentState in enumerate(self.agentStates):
+            if agentState is not oldStates[index]:
+                key ^= keys.agentKey(index, oldStates[index]) ^ keys.agentKey(index, agentState)
+        if self._foodEaten != None:
+            x, y = self._foodEaten
+            key ^= keys.food[x][y]
+        if self._capsuleEaten != None:
+            x, y = self._capsuleEaten
+            key ^= keys.capsules[x][y]
+        self._zobrist = key
+
     def copyAgentStates( self, agentStates ):
         copiedStates = []
         for agentState in agentStates:
             copiedStates.append( agentState.copy() )
         return copiedStates
 
+    def copyAgentState( self, agentIndex ):
+        """
+        Replaces the agent state at agentIndex, which may be shared with the
+        predecessor, by a private copy and returns it for modification.
+        """
+        agentState = self.agentStates[agentIndex].copy()
+        self.agentStates[agentIndex] = agentState
+        return agentState
+
     def __eq__( self, other ):
         """
         Allows two states to be compared.
@@ -424,13 +781,11 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError, e:
-                print e
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        if self._zobrist == None:
+            if self.zobristKeys == None:
+                return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+            self._zobrist = self.zobristKeys.stateKey(self)
+        return self._zobrist ^ hash(self.score)
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
@@ -503,6 +858,8 @@ class GameStateData:
                 else: numGhosts += 1
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
+        self.zobristKeys = getZobristKeys(layout)
+        self._zobrist = self.zobristKeys.stateKey(self)
 
 try:
     import boinc
@@ -513,9 +870,12 @@ except:
 class Game:
     """
     The Game manages the control flow, soliciting actions from agents.
+
+    A headless game without exception handling runs a faster loop (see
+    runHeadless) meant for games nobody watches.
     """
 
-    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False ):
+    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False, headless=False ):
         self.agentCrashed = False
         self.agents = agents
         self.display = display
@@ -524,6 +884,7 @@ class Game:
         self.gameOver = False
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
+        self.headless = headless
         self.moveHistory = []
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
@@ -568,6 +929,8 @@ class Game:
         """
         Main control loop for game play.
         """
+        if self.headless and not self.catchExceptions:
+            return self.runHeadless()
         self.display.initialize(self.state.data)
         self.numMoves = 0
 
@@ -707,7 +1070,8 @@ class Game:
             # Allow for game specific conditions (winning, losing, etc.)
             self.rules.process(self.state, self)
             # Track progress
-            if agentIndex == numAgents + 1: self.numMoves += 1
+            # Count a move once every agent has moved
+            if agentIndex == numAgents - 1: self.numMoves += 1
             # Next agent
             agentIndex = ( agentIndex + 1 ) % numAgents
 
@@ -727,3 +1091,54 @@ class Game:
                     self.unmute()
                     return
         self.display.finish()
+
+    def runHeadless( self ):
+        """
+        The control loop of run for games without exception handling, time
+        limits or a display to update after every move.  Agent methods are
+        looked up once per game rather than once per move, agents observe
+        read-only views of the state (see GameState.readOnlyView) instead of
+        deep copies, and output is only redirected when agents are muted.
+        """
+        self.display.initialize(self.state.data)
+        self.numMoves = 0
+        muted = self.muteAgents
+
+        for i in range(len(self.agents)):
+            agent = self.agents[i]
+            if not agent:
+                print >>sys.stderr, "Agent %d failed to load" % i
+                self._agentCrash(i, quiet=True)
+                return
+            if hasattr(agent, 'registerInitialState'):
+                if muted: self.mute(i)
+                agent.registerInitialState(self.state.deepCopy())
+                if muted: self.unmute()
+
+        observers = [getattr(agent, 'observationFunction', None) for agent in self.agents]
+        actors = [agent.getAction for agent in self.agents]
+        agentIndex = self.startingIndex
+        numAgents = len( self.agents )
+
+        while not self.gameOver:
+            if muted: self.mute(agentIndex)
+            observation = self.state.readOnlyView()
+            observer = observers[agentIndex]
+            if observer != None:
+                observation = observer(observation)
+            action = actors[agentIndex](observation)
+            if muted: self.unmute()
+
+            self.moveHistory.append( (agentIndex, action) )
+            self.state = self.state.generateSuccessor( agentIndex, action )
+            self.rules.process(self.state, self)
+            # Count a move once every agent has moved
+            if agentIndex == numAgents - 1: self.numMoves += 1
+            agentIndex = ( agentIndex + 1 ) % numAgents
+
+        for agentIndex, agent in enumerate(self.agents):
+            if hasattr(agent, 'final'):
+                if muted: self.mute(agentIndex)
+                agent.final( self.state )
+                if muted: self.unmute()
+        self.display.finish()
@@ -13,27 +13,45 @@
 
 
 from util import manhattanDistance
-from game import Grid
+from game import Grid, MoveTable
 import os
 import random
+import array
+import collections
+import hashlib
+import mmap
+import struct
+import sys
 
 VISIBILITY_MATRIX_CACHE = {}
+MAZE_DISTANCES_CACHE = {}
+MOVE_TABLE_CACHE = {}
 
 class Layout:
     """
     A Layout manages the static information about the game board.
     """
 
-    def __init__(self, layoutText):
+    def __init__(self, layoutText, gridClass=Grid):
+        """
+        gridClass is the Grid implementation used for the walls and food,
+        e.g. game.ArrayGrid.
+        """
         self.width = len(layoutText[0])
         self.height= len(layoutText)
-        self.walls = Grid(self.width, self.height, False)
-        self.food = Grid(self.width, self.height, False)
+        self.gridClass = gridClass
+        self.walls = gridClass(self.width, self.height, False)
+        self.food = gridClass(self.width, self.height, False)
         self.capsules = []
         self.agentPositions = []
         self.numGhosts = 0
+        self.mazeDistances = None
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
+        key = '\n'.join(layoutText)
+        if key not in MOVE_TABLE_CACHE:
+            MOVE_TABLE_CACHE[key] = MoveTable(self.walls)
+        self.walls.moveTable = MOVE_TABLE_CACHE[key]
         self.totalFood = len(self.food.asList())
         # self.initializeVisibilityMatrix()
 
@@ -61,6 +79,36 @@ class Layout:
         else:
             self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
 
+    def getMazeDistances(self):
+        """
+        Returns the MazeDistances oracle for this layout, computing it the
+        first time it is requested for a given maze.
+        """
+        if self.mazeDistances is None:
+            key = '\n'.join(self.layoutText)
+            if key not in MAZE_DISTANCES_CACHE:
+                MAZE_DISTANCES_CACHE[key] = MazeDistances(self.walls)
+            self.mazeDistances = MAZE_DISTANCES_CACHE[key]
+        return self.mazeDistances
+
+    def getTextHash(self):
+        "Returns a hex digest identifying the text of this layout"
+        return hashlib.sha1('\n'.join(self.layoutText)).hexdigest()
+
+    def attachMazeDistances(self, directory):
+        """
+        Uses the distance table file for this layout in directory, writing
+        it first if it does not exist yet.  The file is memory-mapped (see
+        MappedMazeDistances), so processes using the same table share one
+        copy of it.
+        """
+        textHash = self.getTextHash()
+        filename = os.path.join(directory, textHash + DISTANCE_TABLE_SUFFIX)
+        if not os.path.exists(filename):
+            MazeDistances(self.walls).save(filename, textHash)
+        self.mazeDistances = MappedMazeDistances(filename, textHash)
+        MAZE_DISTANCES_CACHE['\n'.join(self.layoutText)] = self.mazeDistances
+
     def isWall(self, pos):
         x, col = pos
         return self.walls[x][col]
@@ -90,7 +138,7 @@ class Layout:
         return "\n".join(self.layoutText)
 
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        return Layout(self.layoutText[:], self.gridClass)
 
     def processLayoutText(self, layoutText):
         """
@@ -128,22 +176,225 @@ class Layout:
         elif layoutChar in  ['1', '2', '3', '4']:
             self.agentPositions.append( (int(layoutChar), (x,y)))
             self.numGhosts += 1
-def getLayout(name, back = 2):
+class MazeDistances:
+    """
+    True maze distances between every pair of open cells of a layout.
+
+    The table is built once by running a breadth-first search from each
+    open cell and is stored as a flat array of unsigned shorts, so that
+    distance(a, b) is two dictionary lookups and an array index.
+    """
+    UNREACHABLE = 0xFFFF
+
+    def __init__(self, walls):
+        self.width = walls.width
+        self.height = walls.height
+        self.cells = [(x, y) for x in range(walls.width)
+                      for y in range(walls.height) if not walls[x][y]]
+        self.cellIndex = dict((cell, i) for i, cell in enumerate(self.cells))
+        self.numCells = len(self.cells)
+        self.table = self._computeTable(walls)
+
+    def _computeTable(self, walls):
+        n = self.numCells
+        cellIndex = self.cellIndex
+        neighbors = []
+        for x, y in self.cells:
+            adjacent = [(x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)]
+            neighbors.append([cellIndex[c] for c in adjacent if c in cellIndex])
+
+        table = array.array('H', [self.UNREACHABLE]) * (n * n)
+        for source in range(n):
+            row = source * n
+            table[row + source] = 0
+            fringe = collections.deque([source])
+            while fringe:
+                cell = fringe.popleft()
+                dist = table[row + cell] + 1
+                for nbr in neighbors[cell]:
+                    if table[row + nbr] == self.UNREACHABLE:
+                        table[row + nbr] = dist
+                        fringe.append(nbr)
+        return table
+
+    def distance(self, pos1, pos2):
+        """
+        Returns the maze distance between two open cells, or None if there
+        is no path between them.
+        """
+        d = self.table[self.cellIndex[pos1] * self.numCells + self.cellIndex[pos2]]
+        if d == self.UNREACHABLE: return None
+        return d
+
+    def nearest(self, pos, targets):
+        """
+        Returns (distance, target) for the target closest to pos in the
+        maze, or (None, None) if none of the targets can be reached.
+        """
+        row = self.cellIndex[pos] * self.numCells
+        table, cellIndex = self.table, self.cellIndex
+        best, bestTarget = self.UNREACHABLE, None
+        for target in targets:
+            d = table[row + cellIndex[target]]
+            if d < best:
+                best, bestTarget = d, target
+        if bestTarget is None: return None, None
+        return best, bestTarget
+
+    def save(self, filename, textHash):
+        """
+        Writes the table in the format read by MappedMazeDistances.  The file
+        is written under a temporary name and renamed into place, so readers
+        never see a partial table.
+        """
+        cellMap = array.array('H', [self.UNREACHABLE]) * (self.width * self.height)
+        for i, (x, y) in enumerate(self.cells):
+            cellMap[x * self.height + y] = i
+        table = self.table
+        if sys.byteorder != 'little':
+            cellMap.byteswap()
+            table = array.array('H', table)
+            table.byteswap()
+        header = struct.pack(DISTANCE_TABLE_HEADER, DISTANCE_TABLE_MAGIC,
+                             DISTANCE_TABLE_VERSION, self.width, self.height,
+                             self.numCells, textHash.decode('hex'))
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmpname = '%s.%d.tmp' % (filename, os.getpid())
+        f = open(tmpname, 'wb')
+        try:
+            f.write(header)
+            f.write(cellMap.tostring())
+            f.write(table.tostring())
+        finally:
+            f.close()
+        os.rename(tmpname, filename)
+
+# Distance table files: a little-endian header (magic, version, width,
+# height, number of open cells, SHA-1 of the layout text), a width * height
+# uint16 map from cell x * height + y to its table index (0xFFFF for walls)
+# and the numCells * numCells uint16 distance table.
+DISTANCE_TABLE_MAGIC = 'PMDT'
+DISTANCE_TABLE_VERSION = 1
+DISTANCE_TABLE_HEADER = '<4sHHHI20s'
+DISTANCE_TABLE_SUFFIX = '.dist'
+DISTANCE_TABLE_DIR = os.path.join('layouts', 'distances')
+
+class MappedMazeDistances:
+    """
+    A MazeDistances table read straight from a memory-mapped table file.
+    Nothing is parsed up front: each query unpacks the few bytes it needs,
+    and the operating system pages the file in on demand and shares it
+    between every process that maps it.
+    """
+    UNREACHABLE = MazeDistances.UNREACHABLE
+
+    def __init__(self, filename, textHash=None):
+        self.filename = filename
+        f = open(filename, 'rb')
+        try:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        magic, version, self.width, self.height, self.numCells, digest = \
+            struct.unpack_from(DISTANCE_TABLE_HEADER, self.data, 0)
+        if magic != DISTANCE_TABLE_MAGIC or version != DISTANCE_TABLE_VERSION:
+            raise Exception('%s is not a version %d distance table'
+                            % (filename, DISTANCE_TABLE_VERSION))
+        self.textHash = digest.encode('hex')
+        if textHash is not None and textHash != self.textHash:
+            raise Exception('%s was built for a different layout' % filename)
+        self.mapOffset = struct.calcsize(DISTANCE_TABLE_HEADER)
+        self.tableOffset = self.mapOffset + 2 * self.width * self.height
+
+    def _index(self, pos):
+        "The table index of an open cell; raises KeyError for any other position, like MazeDistances"
+        x, y = pos
+        if 0 <= x < self.width and 0 <= y < self.height and x == int(x) and y == int(y):
+            i = struct.unpack_from('<H', self.data, self.mapOffset + 2 * (int(x) * self.height + int(y)))[0]
+            if i != self.UNREACHABLE: return i
+        raise KeyError(pos)
+
+    def distance(self, pos1, pos2):
+        """
+        Returns the maze distance between two open cells, or None if there
+        is no path between them.
+        """
+        i, j = self._index(pos1), self._index(pos2)
+        d = struct.unpack_from('<H', self.data, self.tableOffset + 2 * (i * self.numCells + j))[0]
+        if d == self.UNREACHABLE: return None
+        return d
+
+    def nearest(self, pos, targets):
+        """
+        Returns (distance, target) for the target closest to pos in the
+        maze, or (None, None) if none of the targets can be reached.
+        """
+        data, unpack = self.data, struct.unpack_from
+        row = self.tableOffset + 2 * self.numCells * self._index(pos)
+        best, bestTarget = self.UNREACHABLE, None
+        for target in targets:
+            d = unpack('<H', data, row + 2 * self._index(target))[0]
+            if d < best:
+                best, bestTarget = d, target
+        if bestTarget is None: return None, None
+        return best, bestTarget
+
+    def __getstate__(self):
+        return {'filename': self.filename, 'textHash': self.textHash}
+
+    def __setstate__(self, state):
+        self.__init__(state['filename'], state['textHash'])
+
+def getLayout(name, back = 2, distanceDir = None, gridClass = Grid):
+    """
+    Loads the layout called name, with its walls and food in grids of
+    gridClass.  If distanceDir is given, the maze distance table stored
+    there for this layout is attached to it (see
+    Layout.attachMazeDistances).
+    """
+    if distanceDir != None:
+        distanceDir = os.path.abspath(distanceDir)
     if name.endswith('.lay'):
-        layout = tryToLoad('layouts/' + name)
-        if layout == None: layout = tryToLoad(name)
+        layout = tryToLoad('layouts/' + name, gridClass)
+        if layout == None: layout = tryToLoad(name, gridClass)
     else:
-        layout = tryToLoad('layouts/' + name + '.lay')
-        if layout == None: layout = tryToLoad(name + '.lay')
+        layout = tryToLoad('layouts/' + name + '.lay', gridClass)
+        if layout == None: layout = tryToLoad(name + '.lay', gridClass)
     if layout == None and back >= 0:
         curdir = os.path.abspath('.')
         os.chdir('..')
-        layout = getLayout(name, back -1)
+        layout = getLayout(name, back -1, distanceDir, gridClass)
         os.chdir(curdir)
+    if layout != None and distanceDir != None and layout.mazeDistances == None:
+        layout.attachMazeDistances(distanceDir)
     return layout
 
-def tryToLoad(fullname):
+def tryToLoad(fullname, gridClass = Grid):
     if(not os.path.exists(fullname)): return None
     f = open(fullname)
-    try: return Layout([line.strip() for line in f])
+    try: return Layout([line.strip() for line in f], gridClass)
     finally: f.close()
+
+if __name__ == '__main__':
+    """
+    Prebuilds the maze distance tables of every layout under layouts/:
+
+    > python layout.py [--dir DIRECTORY]
+    """
+    from optparse import OptionParser
+    parser = OptionParser('USAGE:      python layout.py <options>')
+    parser.add_option('-d', '--dir', dest='distanceDir',
+                      help='directory to write the tables to [Default: %default]',
+                      default=DISTANCE_TABLE_DIR)
+    options, otherjunk = parser.parse_args(sys.argv[1:])
+    if len(otherjunk) != 0:
+        raise Exception('Command line input not understood: ' + str(otherjunk))
+
+    for name in sorted(os.listdir('layouts')):
+        if not name.endswith('.lay'): continue
+        lay = tryToLoad(os.path.join('layouts', name))
+        lay.attachMazeDistances(options.distanceDir)
+        print '%-24s %5d cells  %s' % (name, lay.mazeDistances.numCells,
+                                       lay.mazeDistances.filename)
@@ -15,9 +15,11 @@
 from util import manhattanDistance
 from game import Directions
 import random, util
+import time
+import multiprocessing
 from itertools import cycle
 
-from game import Agent
+from game import Agent, AgentState, Configuration, reconstituteGrid, getZobristKeys
 
 class ReflexAgent(Agent):
     """
@@ -108,12 +110,262 @@ class MultiAgentSearchAgent(Agent):
       Note: this is an abstract class: one that should not be instantiated.  It's
       only partially specified, and designed to be extended.  Agent (game.py)
       is another abstract class.
+
+      Passing tt=N (e.g. -a depth=3,tt=100000) keeps a transposition table of
+      up to N searched positions across moves; ttPolicy picks its replacement
+      scheme, 'lru' or 'depth' (see util.TranspositionTable).
+
+      Passing timeBudget=S makes the agents that support it search anytime:
+      depth is ignored, and the search deepens one ply at a time (up to
+      maxDepth) until S seconds have been spent on the move.
+
+      Passing workers=N splits the search at the root: each of Pacman's
+      actions is searched by one of N worker processes, which live until
+      the end of the game.  Games played by pacman.py --parallel run in
+      worker processes themselves, which cannot start workers of their
+      own, so there the agents search serially.  Passing compareSerial=1 as
+      well searches the same root actions again one after the other in this
+      process after every parallel search, and reports the measured speedup.
     """
 
-    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2'):
+    def __init__(self, evalFn = 'scoreEvaluationFunction', depth = '2', tt = '0', ttPolicy = 'lru',
+                 timeBudget = '0', maxDepth = '50', workers = '0', compareSerial = '0'):
         self.index = 0 # Pacman is always agent index 0
+        # Arguments the worker processes build their own copy of the agent with
+        self.args = {'evalFn': evalFn, 'depth': depth, 'tt': tt, 'ttPolicy': ttPolicy,
+                     'maxDepth': maxDepth}
         self.evaluationFunction = util.lookup(evalFn, globals())
         self.depth = int(depth)
+        self.table = None
+        if int(tt) > 0:
+            self.table = util.TranspositionTable(int(tt), ttPolicy)
+        self.nodes = 0
+        self.successors = 0
+        self.timeBudget = float(timeBudget)
+        self.maxDepth = int(maxDepth)
+        self.deadline = None
+        self.bestMoves = {}
+        self.completedDepths = []
+        self.workers = int(workers)
+        self.pool = None
+        self.sharedAlpha = None
+        self.workerTime = 0.0
+        self.parallelTime = 0.0
+        self.compareSerial = int(compareSerial) > 0
+        self.serialAgent = None
+        self.serialTime = 0.0
+
+    def iterativeDeepening(self, gameState, search):
+        """
+          Runs search(gameState), a fixed-depth search at self.depth returning
+          (value, action), for depths 1, 2, ... until the time budget is spent
+          and returns the action of the deepest search that completed.  The
+          first iteration always completes.  Each iteration tries the best
+          moves found by the previous one first (see orderActions).
+        """
+        start = time.time()
+        fixedDepth = self.depth
+        self.bestMoves = {}
+        result, completed = None, 0
+        try:
+            for depth in range(1, self.maxDepth + 1):
+                self.depth = depth
+                try:
+                    result = search(gameState)
+                except SearchTimeout:
+                    break
+                completed = depth
+                self.bestMoves[(gameState, self.index)] = result[1]
+                self.deadline = start + self.timeBudget
+                if time.time() > self.deadline:
+                    break
+        finally:
+            self.depth = fixedDepth
+            self.deadline = None
+        self.completedDepths.append(completed)
+        return result[1]
+
+    def checkDeadline(self):
+        if self.deadline != None and time.time() > self.deadline:
+            raise SearchTimeout()
+
+    def recordBestMove(self, gameState, agentIndex, v):
+        "Remembers the best move of a node for the next deepening iteration"
+        if self.timeBudget > 0 and len(v) > 1:
+            self.bestMoves[(gameState, agentIndex)] = v[1]
+
+    def orderActions(self, gameState, agentIndex, actions):
+        "Moves the best move recorded for this node, if any, to the front"
+        if self.bestMoves:
+            best = self.bestMoves.get((gameState, agentIndex))
+            if best in actions:
+                actions = [best] + [a for a in actions if a != best]
+        return actions
+
+    def searchesInParallel(self):
+        "Whether to split the search at the root (see workers above)"
+        return self.workers > 0 and not multiprocessing.current_process().daemon
+
+    def searchInParallel(self, gameState, actions, alpha=None):
+        """
+          Returns the values of Pacman's root actions, each searched by a
+          worker process with rootValue.  Workers start from the best alpha
+          known when they pick up an action, so with alpha given the values
+          below it are only upper bounds, as in a serial alpha-beta search.
+        """
+        if self.pool == None:
+            self.sharedAlpha = multiprocessing.Value('d', float('-inf'))
+            self.pool = multiprocessing.Pool(self.workers, initWorker,
+                                             (self.__class__, self.args, self.sharedAlpha))
+        if alpha != None:
+            self.sharedAlpha.value = alpha
+        start = time.time()
+        state = compactState(gameState)
+        results = [self.pool.apply_async(searchRootAction,
+                                         (state, action, self.depth, self.deadline, alpha != None))
+                   for action in actions]
+        values = []
+        for result in results:
+            value, nodes, successors, seconds = result.get()
+            self.nodes += nodes
+            self.successors += successors
+            self.workerTime += seconds
+            values.append(value)
+        self.parallelTime += time.time() - start
+        if None in values:
+            raise SearchTimeout()
+        if self.compareSerial:
+            self.serialTime += self.timeSerialSearch(gameState, actions, alpha)
+        return values
+
+    def timeSerialSearch(self, gameState, actions, alpha=None):
+        """
+          Searches the root actions of a parallel search again, one after the
+          other in this process, and returns the wall time taken.  The search
+          is done by an agent built like the workers' (with its own tables),
+          and the random state is restored afterwards (expect_util draws from
+          it), so the measurement does not change the game.
+        """
+        if self.serialAgent == None:
+            self.serialAgent = self.__class__(**self.args)
+        agent = self.serialAgent
+        agent.num_agents = gameState.getNumAgents()
+        agent.depth = self.depth
+        shareAlpha = alpha != None
+        if not shareAlpha: alpha = float('-inf')
+        randomState = random.getstate()
+        start = time.time()
+        try:
+            for action in actions:
+                value = agent.rootValue(gameState, action, alpha)
+                if shareAlpha: alpha = max(alpha, value)
+            return time.time() - start
+        finally:
+            random.setstate(randomState)
+
+    def remainingDepth(self, depth):
+        "Number of plies left below a node reached after depth + 1 plies"
+        return self.depth * self.num_agents - 1 - depth
+
+    def final(self, state):
+        if self.table != None:
+            print 'Transposition table: %s; %d nodes searched' % (self.table, self.nodes)
+        if self.completedDepths:
+            print 'Iterative deepening: average depth %.2f over %d moves' % \
+                (sum(self.completedDepths) / float(len(self.completedDepths)), len(self.completedDepths))
+        if self.parallelTime > 0:
+            # Worker CPU time over wall time: how many workers were busy on
+            # average, an upper bound on the speedup over a serial search
+            print 'Root-parallel search: %d workers, %.2f busy on average (%.1fs of worker CPU time in %.1fs)' % \
+                (self.workers, self.workerTime / self.parallelTime, self.workerTime, self.parallelTime)
+        if self.serialTime > 0:
+            print 'Root-parallel search: %.2fx speedup over the serial search (%.1fs serial, %.1fs parallel)' % \
+                (self.serialTime / self.parallelTime, self.serialTime, self.parallelTime)
+        if self.pool != None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+class SearchTimeout(Exception):
+    "Raised to abandon a search iteration whose time budget has run out"
+    pass
+
+def compactState(gameState):
+    """
+      Returns a picklable tuple holding what restoreState needs to rebuild
+      gameState: the layout is sent as its text and the food in the binary
+      format of Grid.toBytes.
+    """
+    data = gameState.data
+    agentStates = tuple((s.start.pos, s.start.direction, s.configuration.pos, s.configuration.direction,
+                         s.isPacman, s.scaredTimer, s.numCarrying, s.numReturned)
+                        for s in data.agentStates)
+    return (tuple(data.layout.layoutText), data.food.toBytes(), tuple(data.capsules), agentStates,
+            tuple(data._eaten), data.score, data._win, data._lose)
+
+WORKER_LAYOUTS = {}
+
+def restoreState(state):
+    "Rebuilds the GameState packed by compactState"
+    import pacman, layout
+    layoutText, food, capsules, agentStates, eaten, score, win, lose = state
+    if layoutText not in WORKER_LAYOUTS:
+        WORKER_LAYOUTS[layoutText] = layout.Layout(list(layoutText))
+    gameState = pacman.GameState()
+    data = gameState.data
+    data.layout = WORKER_LAYOUTS[layoutText]
+    data.food = reconstituteGrid(food)
+    data.capsules = list(capsules)
+    data.agentStates = []
+    for startPos, startDir, pos, direction, isPacman, scaredTimer, numCarrying, numReturned in agentStates:
+        agentState = AgentState(Configuration(startPos, startDir), isPacman)
+        agentState.configuration = Configuration(pos, direction)
+        agentState.scaredTimer = scaredTimer
+        agentState.numCarrying = numCarrying
+        agentState.numReturned = numReturned
+        data.agentStates.append(agentState)
+    data._eaten = list(eaten)
+    data.score = score
+    data._win = win
+    data._lose = lose
+    data.zobristKeys = getZobristKeys(data.layout)
+    return gameState
+
+# The agent and shared alpha of a worker process, set up by initWorker
+WORKER_AGENT = None
+WORKER_ALPHA = None
+
+def initWorker(agentClass, args, sharedAlpha):
+    global WORKER_AGENT, WORKER_ALPHA
+    WORKER_AGENT = agentClass(**args)
+    WORKER_ALPHA = sharedAlpha
+
+def searchRootAction(state, action, depth, deadline, shareAlpha):
+    """
+      Searches one of Pacman's root actions in a worker process.  Returns its
+      value (None if the deadline passed), the number of nodes searched and
+      successors generated, and the processor time taken.
+    """
+    start = time.clock()
+    agent = WORKER_AGENT
+    gameState = restoreState(state)
+    agent.num_agents = gameState.getNumAgents()
+    agent.depth = depth
+    agent.deadline = deadline
+    nodes, successors = agent.nodes, agent.successors
+    alpha = WORKER_ALPHA.value if shareAlpha else float('-inf')
+    try:
+        value = agent.rootValue(gameState, action, alpha)
+    except SearchTimeout:
+        value = None
+    if shareAlpha and value != None:
+        lock = WORKER_ALPHA.get_lock()
+        lock.acquire()
+        try:
+            WORKER_ALPHA.value = max(WORKER_ALPHA.value, value)
+        finally:
+            lock.release()
+    return value, agent.nodes - nodes, agent.successors - successors, time.clock() - start
 
 
 class MinimaxAgent(MultiAgentSearchAgent):
@@ -149,15 +401,34 @@ class MinimaxAgent(MultiAgentSearchAgent):
         if self.isTerminalState(gameState, depth):
             return (self.evaluationFunction(gameState),)
 
+        if self.table != None:
+            entry = self.table.lookup(gameState, agentIndex, self.remainingDepth(depth))
+            if entry != None:
+                return (entry[0],)
+
         if agentIndex == 0:
-            return self.max_util(gameState, agentIndex, depth)
+            v = self.max_util(gameState, agentIndex, depth)
         else:
-            return self.min_util(gameState, agentIndex, depth)
+            v = self.min_util(gameState, agentIndex, depth)
+
+        if self.table != None:
+            self.table.store(gameState, agentIndex, self.remainingDepth(depth), v[0])
+        return v
+
+    def rootValue(self, gameState, action, alpha):
+        "Value of Pacman taking action in the root gameState"
+        successorState = gameState.generateSuccessor(0, action)
+        return self.getUtility(successorState, self.nextAgent(0), 0)[0]
 
     def max_util(self, gameState, agentIndex, depth=-1):
         v = (float('-inf'), 'STOP')
         depth += 1
+        self.nodes += 1
         legalActions = gameState.getLegalActions(agentIndex)
+        if depth == 0 and self.searchesInParallel():
+            values = self.searchInParallel(gameState, legalActions)
+            best = values.index(max(values))
+            return (values[best], legalActions[best])
         for action in legalActions:
             successorState = gameState.generateSuccessor(agentIndex, action)
             v_util = self.getUtility(successorState, self.nextAgent(agentIndex), depth)
@@ -168,6 +439,7 @@ class MinimaxAgent(MultiAgentSearchAgent):
     def min_util(self, gameState, agentIndex, depth):
         v = (float('inf'), 'STOP')
         depth += 1
+        self.nodes += 1
         legalActions = gameState.getLegalActions(agentIndex)
         for action in legalActions:
             successorState = gameState.generateSuccessor(agentIndex, action)
@@ -187,40 +459,120 @@ class MinimaxAgent(MultiAgentSearchAgent):
 class AlphaBetaAgent(MultiAgentSearchAgent):
     """
       Your minimax agent with alpha-beta pruning (question 3)
+
+      Passing ordering=H (e.g. -a depth=3,ordering=eval+killer+history) tries
+      the moves most likely to cause a cutoff first.  H joins any of:
+
+        eval     sort moves by the evaluation of their successor at nodes
+                 fewer than orderDepth plies below the root
+        killer   try the last two moves that caused a cutoff at the same ply
+        history  try moves that caused cutoffs from the same position
+                 for the same agent before others
+
+      Ties at the root are broken in legal action order, so the chosen action
+      is the one the unordered search would pick.  Passing any ordering,
+      including 'none', reports the nodes searched per move.
     """
 
+    def __init__(self, ordering = None, orderDepth = '2', **args):
+        MultiAgentSearchAgent.__init__(self, **args)
+        self.args.update(ordering=ordering, orderDepth=orderDepth)
+        self.ordering = None
+        if ordering != None:
+            self.ordering = set(ordering.split('+')) - set(['none'])
+            for heuristic in self.ordering:
+                if heuristic not in ('eval', 'killer', 'history'):
+                    raise Exception('Unknown move ordering heuristic: ' + heuristic)
+        self.orderDepth = int(orderDepth)
+        self.killers = {}
+        self.history = util.Counter()
+        self.moveNodes = []
+
     def getAction(self, gameState):
         """
           Returns the minimax action using self.depth and self.evaluationFunction
         """
         #Number of agents
         self.num_agents = gameState.getNumAgents()
+        self.killers = {}
+        nodes, successors = self.nodes, self.successors
 
         alpha = float('-inf')
         beta = float('inf')
-        max_util_action = self.max_util(gameState, agentIndex=0, alpha=alpha, beta=beta)
+        if self.timeBudget > 0:
+            action = self.iterativeDeepening(gameState,
+                lambda state: self.max_util(state, agentIndex=0, alpha=alpha, beta=beta))
+        else:
+            action = self.max_util(gameState, agentIndex=0, alpha=alpha, beta=beta)[1]
 
-        return max_util_action[1] # Return max utility
+        if self.ordering != None:
+            self.moveNodes.append((self.nodes - nodes, self.successors - successors))
+        return action # Return max utility
 
     def getUtility(self, gameState, agentIndex, alpha, beta, depth):
         if self.isTerminalState(gameState, depth):
             return (self.evaluationFunction(gameState),)
+        self.checkDeadline()
+
+        table = self.table
+        if table != None:
+            entry = table.lookup(gameState, agentIndex, self.remainingDepth(depth))
+            if entry != None:
+                value, bound = entry
+                # Bounds only settle the node when they would cause the same
+                # cutoff the search itself would make
+                if bound == table.EXACT \
+                   or (bound == table.LOWER and value > beta) \
+                   or (bound == table.UPPER and value < alpha):
+                    return (value,)
 
         if agentIndex == 0:
-            return self.max_util(gameState, agentIndex, alpha, beta, depth)
+            v = self.max_util(gameState, agentIndex, alpha, beta, depth)
         else:
-            return self.min_util(gameState, agentIndex, alpha, beta, depth)
+            v = self.min_util(gameState, agentIndex, alpha, beta, depth)
+
+        if table != None:
+            if v[0] > beta:
+                bound = table.LOWER
+            elif v[0] < alpha:
+                bound = table.UPPER
+            else:
+                bound = table.EXACT
+            table.store(gameState, agentIndex, self.remainingDepth(depth), v[0], bound)
+        self.recordBestMove(gameState, agentIndex, v)
+        return v
+
+    def rootValue(self, gameState, action, alpha):
+        "Value of Pacman taking action in the root gameState, if above alpha"
+        successorState = gameState.generateSuccessor(0, action)
+        return self.getUtility(successorState, self.nextAgent(0), alpha, float('inf'), 0)[0]
 
     def max_util(self, gameState, agentIndex, alpha, beta, depth=-1):
         v = (float('-inf'), 'STOP')
         depth += 1
-        legalActions = gameState.getLegalActions(agentIndex)
+        self.nodes += 1
+        legalActions, successors = self.orderMoves(gameState, agentIndex, depth)
+        if depth == 0:
+            # Break ties at the root in legal action order, whatever the ordering
+            rank = dict((action, i) for i, action in enumerate(gameState.getLegalActions(agentIndex)))
+            if self.searchesInParallel() and len(legalActions) > 1:
+                # Search the most promising action here for a first alpha to
+                # hand the workers, then the other actions in parallel
+                successorState = self.generateSuccessor(gameState, agentIndex, legalActions[0], successors)
+                v = (self.getUtility(successorState, self.nextAgent(agentIndex), alpha, beta, depth)[0],
+                     legalActions[0])
+                values = self.searchInParallel(gameState, legalActions[1:], max(alpha, v[0]))
+                for action, value in zip(legalActions[1:], values):
+                    if value > v[0] or (value == v[0] and rank[action] < rank[v[1]]):
+                        v = (value, action)
+                return v
         for action in legalActions:
-            successorState = gameState.generateSuccessor(agentIndex, action)
+            successorState = self.generateSuccessor(gameState, agentIndex, action, successors)
             v_util = self.getUtility(successorState, self.nextAgent(agentIndex), alpha, beta, depth)
-            if v_util[0] > v[0]:
+            if v_util[0] > v[0] or (depth == 0 and v_util[0] == v[0] and rank[action] < rank.get(v[1], -1)):
                 v = (v_util[0], action)
             if v[0] > beta:
+                self.recordCutoff(gameState, agentIndex, action, depth)
                 return v
             alpha = max(alpha, v[0])
         return v
@@ -228,17 +580,85 @@ class AlphaBetaAgent(MultiAgentSearchAgent):
     def min_util(self, gameState, agentIndex, alpha, beta, depth):
         v = (float('inf'), 'STOP')
         depth += 1
-        legalActions = gameState.getLegalActions(agentIndex)
+        self.nodes += 1
+        legalActions, successors = self.orderMoves(gameState, agentIndex, depth)
         for action in legalActions:
-            successorState = gameState.generateSuccessor(agentIndex, action)
+            successorState = self.generateSuccessor(gameState, agentIndex, action, successors)
             v_util = self.getUtility(successorState, self.nextAgent(agentIndex), alpha, beta, depth)
             if v_util[0] < v[0]:
                 v = (v_util[0], action)
             if v[0] < alpha:
+                self.recordCutoff(gameState, agentIndex, action, depth)
                 return v
             beta = min(beta, v[0])
         return v
 
+    def generateSuccessor(self, gameState, agentIndex, action, successors):
+        "Returns the successor, reusing the one generated for ordering if any"
+        if action in successors:
+            return successors[action]
+        self.successors += 1
+        return gameState.generateSuccessor(agentIndex, action)
+
+    def orderMoves(self, gameState, agentIndex, depth):
+        """
+          Returns the legal actions of a node in the order they should be
+          searched, and a dictionary of the successors already generated to
+          order them.
+        """
+        legalActions = gameState.getLegalActions(agentIndex)
+        successors = {}
+        ordering = self.ordering
+        if ordering:
+            if 'eval' in ordering and depth < self.orderDepth:
+                for action in legalActions:
+                    successors[action] = gameState.generateSuccessor(agentIndex, action)
+                self.successors += len(legalActions)
+                values = dict((action, self.evaluationFunction(successors[action]))
+                              for action in legalActions)
+                # Best moves first: high values for Pacman, low ones for ghosts
+                sign = -1 if agentIndex == 0 else 1
+                legalActions = sorted(legalActions, key=lambda action: sign * values[action])
+            else:
+                if 'history' in ordering:
+                    position = self.agentPosition(gameState, agentIndex)
+                    history = self.history
+                    legalActions = sorted(legalActions,
+                        key=lambda action: -history[(agentIndex, action, position)])
+                if 'killer' in ordering:
+                    killers = [a for a in self.killers.get(depth, ()) if a in legalActions]
+                    legalActions = killers + [a for a in legalActions if a not in killers]
+        return self.orderActions(gameState, agentIndex, legalActions), successors
+
+    def recordCutoff(self, gameState, agentIndex, action, depth):
+        "Credits action with a cutoff for the killer and history heuristics"
+        if not self.ordering:
+            return
+        if 'killer' in self.ordering:
+            killers = self.killers.setdefault(depth, [])
+            if action not in killers:
+                killers.insert(0, action)
+                del killers[2:]
+        if 'history' in self.ordering:
+            # Cutoffs high in the tree prune more, so they count for more
+            remaining = self.remainingDepth(depth) + 1
+            self.history[(agentIndex, action, self.agentPosition(gameState, agentIndex))] += remaining * remaining
+
+    def agentPosition(self, gameState, agentIndex):
+        if agentIndex == 0:
+            return gameState.getPacmanPosition()
+        return gameState.getGhostPosition(agentIndex)
+
+    def final(self, state):
+        MultiAgentSearchAgent.final(self, state)
+        if self.moveNodes:
+            nodes = [n for n, _ in self.moveNodes]
+            successors = [s for _, s in self.moveNodes]
+            print 'Move ordering (%s): %.1f nodes, %.1f successors per move (max %d nodes) over %d moves' % \
+                ('+'.join(sorted(self.ordering)) or 'none',
+                 sum(nodes) / float(len(nodes)), sum(successors) / float(len(successors)),
+                 max(nodes), len(nodes))
+
     def isTerminalState(self, gameState, depth):
         return len(gameState.getLegalActions()) == 0 \
                or depth == self.depth * self.num_agents - 1
@@ -262,6 +682,10 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
         #Number of agents
         self.num_agents = gameState.getNumAgents()
 
+        if self.timeBudget > 0:
+            return self.iterativeDeepening(gameState,
+                lambda state: self.max_util(state, agentIndex=0))
+
         max_util_action = self.max_util(gameState, agentIndex=0)
 
         return max_util_action[1] # Return max utility
@@ -269,16 +693,38 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
     def getUtility(self, gameState, agentIndex, depth):
         if self.isTerminalState(gameState, depth):
             return (self.evaluationFunction(gameState),)
+        self.checkDeadline()
+
+        if self.table != None:
+            entry = self.table.lookup(gameState, agentIndex, self.remainingDepth(depth))
+            if entry != None:
+                return (entry[0],)
 
         if agentIndex == 0:
-            return self.max_util(gameState, agentIndex, depth)
+            v = self.max_util(gameState, agentIndex, depth)
         else:
-            return self.expect_util(gameState, agentIndex, depth)
+            v = self.expect_util(gameState, agentIndex, depth)
+
+        if self.table != None:
+            self.table.store(gameState, agentIndex, self.remainingDepth(depth), v[0])
+        if agentIndex == 0:
+            self.recordBestMove(gameState, agentIndex, v)
+        return v
+
+    def rootValue(self, gameState, action, alpha):
+        "Value of Pacman taking action in the root gameState"
+        successorState = gameState.generateSuccessor(0, action)
+        return self.getUtility(successorState, self.nextAgent(0), 0)[0]
 
     def max_util(self, gameState, agentIndex, depth=-1):
         v = (float('-inf'), 'STOP')
         depth += 1
-        legalActions = gameState.getLegalActions(agentIndex)
+        self.nodes += 1
+        legalActions = self.orderActions(gameState, agentIndex, gameState.getLegalActions(agentIndex))
+        if depth == 0 and self.searchesInParallel():
+            values = self.searchInParallel(gameState, legalActions)
+            best = values.index(max(values))
+            return (values[best], legalActions[best])
         for action in legalActions:
             successorState = gameState.generateSuccessor(agentIndex, action)
             v_util = self.getUtility(successorState, self.nextAgent(agentIndex), depth)
@@ -288,6 +734,7 @@ class ExpectimaxAgent(MultiAgentSearchAgent):
 
     def expect_util(self, gameState, agentIndex, depth):
         depth += 1
+        self.nodes += 1
         v_total = 0  # total utility from all possible actions
         legalActions = gameState.getLegalActions(agentIndex)
         for action in legalActions:
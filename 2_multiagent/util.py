@@ -15,6 +15,7 @@
 import sys
 import inspect
 import heapq, random
+import collections
 import cStringIO
 
 
@@ -201,6 +202,82 @@ class PriorityQueueWithFunction(PriorityQueue):
         "Adds an item to the queue with priority from the priority function"
         PriorityQueue.push(self, item, self.priorityFunction(item))
 
+class TranspositionTable:
+    """
+      A bounded store of game-tree search results, keyed by a state, the
+      index of the agent to move and the remaining search depth.  Each entry
+      holds a value and whether it is EXACT or only a LOWER or UPPER bound
+      (as left behind by alpha-beta cutoffs).
+
+      Two replacement policies are available once the table is full:
+        'lru'   - evict the least recently used entry
+        'depth' - a fixed array of slots indexed by the key's hash, where a
+                  new entry only replaces one searched to at most its depth
+
+      hits, misses and collisions count lookups; a collision is a miss where
+      the key's hash matched an entry for a different position.
+    """
+    EXACT, LOWER, UPPER = 'exact', 'lower', 'upper'
+
+    def __init__(self, size, policy='lru'):
+        if policy not in ['lru', 'depth']:
+            raise Exception('Unknown transposition table policy: ' + str(policy))
+        self.size = size
+        self.policy = policy
+        if policy == 'lru':
+            self.table = collections.OrderedDict()
+        else:
+            self.table = [None] * size
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    def lookup(self, state, agentIndex, depth):
+        """
+          Returns the (value, bound) stored for the key, or None.
+        """
+        key = (hash(state), agentIndex, depth)
+        if self.policy == 'lru':
+            entry = self.table.pop(key, None)
+            if entry != None:
+                self.table[key] = entry
+        else:
+            entry = self.table[hash(key) % self.size]
+            if entry != None and entry[1] != key:
+                entry = None
+        if entry == None:
+            self.misses += 1
+            return None
+        if not entry[0] == state:
+            self.misses += 1
+            self.collisions += 1
+            return None
+        self.hits += 1
+        return entry[2], entry[3]
+
+    def store(self, state, agentIndex, depth, value, bound=EXACT):
+        key = (hash(state), agentIndex, depth)
+        entry = (state, key, value, bound)
+        if self.policy == 'lru':
+            self.table.pop(key, None)
+            self.table[key] = entry
+            if len(self.table) > self.size:
+                self.table.popitem(last=False)
+        else:
+            slot = hash(key) % self.size
+            old = self.table[slot]
+            if old == None or old[1][2] <= depth:
+                self.table[slot] = entry
+
+    def __len__(self):
+        if self.policy == 'lru':
+            return len(self.table)
+        return self.size - self.table.count(None)
+
+    def __str__(self):
+        return '%d hits, %d misses, %d collisions, %d entries' % \
+            (self.hits, self.misses, self.collisions, len(self))
+
 
 def manhattanDistance( xy1, xy2 ):
     "Returns the Manhattan distance between points xy1 and xy2"
@@ -44,6 +44,9 @@ class CrawlingRobotEnvironment(environment.Environment):
         self.handBuckets = [minHandAngle+(handIncrement*i) \
          for i in range(self.nHandStates)]
 
+        # (nextState, reward) of each (state, action), see step_batch
+        self.transitions = None
+
         # Reset
         self.reset()
 
@@ -131,6 +134,38 @@ class CrawlingRobotEnvironment(environment.Environment):
         self.state = armState,handState
         self.crawlingRobot.setAngles(self.armBuckets[armState],self.handBuckets[handState])
         self.crawlingRobot.positions = [20,self.crawlingRobot.getRobotPosition()[0]]
+        return self.state
+
+    def step_batch(self, states, actions):
+        """
+          The robot moves the same distance whenever
+          it takes an action in a state, so the batch
+          is stepped through a table of (nextState,
+          reward) pairs, worked out on first use
+          without moving the robot
+        """
+        if self.transitions == None:
+            self.transitions = {}
+            robot = self.crawlingRobot
+            for armBucket in range(self.nArmStates):
+                for handBucket in range(self.nHandStates):
+                    state = (armBucket, handBucket)
+                    for action in self.getPossibleActions(state):
+                        nextState = {'arm-up': (armBucket+1, handBucket),
+                                     'arm-down': (armBucket-1, handBucket),
+                                     'hand-up': (armBucket, handBucket+1),
+                                     'hand-down': (armBucket, handBucket-1)}[action]
+                        reward = robot.displacement(self.armBuckets[armBucket], self.handBuckets[handBucket],
+                                                    self.armBuckets[nextState[0]], self.handBuckets[nextState[1]])
+                        self.transitions[(state, action)] = (nextState, reward)
+        transitions = self.transitions
+        nextStates, rewards = [], []
+        for state, action in zip(states, actions):
+            nextState, reward = transitions[(state, action)]
+            nextStates.append(nextState)
+            rewards.append(reward)
+        # The robot never stops crawling
+        return nextStates, rewards, [False] * len(nextStates)
 
 
 class CrawlingRobot:
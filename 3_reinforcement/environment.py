@@ -43,6 +43,29 @@ class Environment:
     def reset(self):
         """
           Resets the current state to the start state
+          and returns it
+        """
+        abstract
+
+    def step(self, action):
+        """
+          Performs the given action like doAction,
+          for training loops.
+
+          Returns a (nextState, reward, done) triple,
+          where done tells whether nextState is terminal
+        """
+        nextState, reward = self.doAction(action)
+        return nextState, reward, len(self.getPossibleActions(nextState)) == 0
+
+    def step_batch(self, states, actions):
+        """
+          Steps a batch of independent copies of the
+          environment, copy i taking actions[i] in
+          states[i], without changing the current state.
+
+          Returns the lists of next states, rewards
+          and done flags of the copies
         """
         abstract
 
@@ -16,6 +16,59 @@
 
 from game import Directions, Actions
 import util
+import collections
+
+class FeatureIndex:
+    """
+    Numbers features so that weights can be kept in a flat array.  With
+    size 0 each new feature gets the next index; with size > 0 features are
+    hashed into that many buckets instead, which bounds the weights for
+    extractors like IdentityExtractor whose features are unbounded.
+    """
+    def __init__(self, size=0):
+        self.size = size
+        self.indices = {}
+        self.names = []
+
+    def lookup(self, feature, add=False):
+        "Returns the index of feature, or None if it is new and add is False"
+        if self.size > 0:
+            return hash(feature) % self.size
+        i = self.indices.get(feature)
+        if i == None and add:
+            i = len(self.names)
+            self.indices[feature] = i
+            self.names.append(feature)
+        return i
+
+    def vectorize(self, features, add=False):
+        """
+        Turns a dict from features to values into a list of indices and a
+        list of values, leaving out unknown features unless add is True.
+        """
+        indices, values = [], []
+        for feature, value in features.items():
+            i = self.lookup(feature, add)
+            if i != None:
+                indices.append(i)
+                values.append(value)
+        return indices, values
+
+    def __len__(self):
+        if self.size > 0:
+            return self.size
+        return len(self.names)
+
+    def toCounter(self, weights):
+        "Maps weights back to a Counter keyed by feature (by bucket if hashed)"
+        counter = util.Counter()
+        if self.size > 0:
+            for i, weight in enumerate(weights):
+                if weight != 0: counter[i] = weight
+        else:
+            for name, weight in zip(self.names, weights):
+                counter[name] = weight
+        return counter
 
 class FeatureExtractor:
     def getFeatures(self, state, action):
@@ -26,6 +79,17 @@ class FeatureExtractor:
         """
         util.raiseNotDefined()
 
+    def getFeaturesForAllActions(self, state, actions):
+        "Returns a dict from each of actions to its features in state"
+        return dict([(action, self.getFeatures(state, action)) for action in actions])
+
+    def getFeatureVector(self, state, action, featureIndex, add=False):
+        """
+          Returns the features as a list of indices into featureIndex
+          and a list of their values (see FeatureIndex.vectorize).
+        """
+        return featureIndex.vectorize(self.getFeatures(state, action), add)
+
 class IdentityExtractor(FeatureExtractor):
     def getFeatures(self, state, action):
         feats = util.Counter()
@@ -63,6 +127,37 @@ def closestFood(pos, food, walls):
     # no food found
     return None
 
+class LRUCache:
+    """
+    A dict of at most capacity entries that drops the least recently used
+    one when full, and counts its hits and misses.
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        "Returns the value stored for key, or None"
+        value = self.entries.pop(key, None)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def getHitRate(self):
+        lookups = self.hits + self.misses
+        if lookups == 0: return 0.0
+        return float(self.hits) / lookups
+
 class SimpleExtractor(FeatureExtractor):
     """
     Returns simple features for a basic reflex Pacman:
@@ -70,13 +165,66 @@ class SimpleExtractor(FeatureExtractor):
     - how far away the next food is
     - whether a ghost collision is imminent
     - whether a ghost is one step away
+
+    The features only depend on the positions of Pacman and the ghosts and
+    on the food, so the last cacheSize results are remembered by those.
+    The returned Counters are shared with the cache: do not modify them.
     """
+    def __init__(self, cacheSize=10000):
+        self.cache = LRUCache(cacheSize)
+
+    def getCacheKey(self, state):
+        """
+        A cheap key for the positions and food of state.  The food and
+        capsules are identified by the Zobrist key of the state with the
+        keys of the agents XOR-ed back out, which avoids hashing the grid.
+        """
+        data = state.data
+        keys = data.zobristKeys
+        if keys == None:
+            foodKey = hash(data.food)
+        else:
+            foodKey = hash(data) ^ hash(data.score)
+            for index, agentState in enumerate(data.agentStates):
+                foodKey ^= keys.agentKey(index, agentState)
+        positions = tuple([agentState.getPosition() for agentState in data.agentStates])
+        return positions, foodKey
 
     def getFeatures(self, state, action):
+        return self.getFeaturesForAllActions(state, [action])[action]
+
+    def getFeaturesForAllActions(self, state, actions):
+        """
+        Looks the features of each action up in the cache and computes the
+        missing ones together, sharing the food list and ghost neighbors.
+        """
+        key = self.getCacheKey(state)
+        allFeatures = {}
+        shared = None
+        for action in actions:
+            features = self.cache.get((key, action))
+            if features is None:
+                if shared == None:
+                    shared = self.getSharedFeatureData(state)
+                features = self.computeFeatures(state, action, shared)
+                self.cache.put((key, action), features)
+            allFeatures[action] = features
+        return allFeatures
+
+    def getSharedFeatureData(self, state):
+        "What computeFeatures needs that is the same for every action"
         # extract the grid of food and wall locations and get the ghost locations
         food = state.getFood()
         walls = state.getWalls()
-        ghosts = state.getGhostPositions()
+        # count, for every cell, the ghosts that can reach it in one step
+        ghostNeighbors = util.Counter()
+        for g in state.getGhostPositions():
+            for neighbor in Actions.getLegalNeighbors(g, walls):
+                ghostNeighbors[neighbor] += 1
+        return food, walls, ghostNeighbors, food.asList()
+
+    def computeFeatures(self, state, action, shared):
+        food, walls, ghostNeighbors, foodList = shared
 
         features = util.Counter()
 
@@ -88,13 +236,14 @@ class SimpleExtractor(FeatureExtractor):
         next_x, next_y = int(x + dx), int(y + dy)
 
         # count the number of ghosts 1-step away
-        features["#-of-ghosts-1-step-away"] = sum((next_x, next_y) in Actions.getLegalNeighbors(g, walls) for g in ghosts)
+        features["#-of-ghosts-1-step-away"] = ghostNeighbors[(next_x, next_y)]
 
         # if there is no danger of ghosts then add the food feature
         if not features["#-of-ghosts-1-step-away"] and food[next_x][next_y]:
             features["eats-food"] = 1.0
 
-        dist = closestFood((next_x, next_y), food, walls)
+        distances = state.data.layout.getMazeDistances()
+        dist, _ = distances.nearest((next_x, next_y), foodList)
         if dist is not None:
             # make the distance a number less than one otherwise the update
             # will diverge wildly
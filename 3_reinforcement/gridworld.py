@@ -213,6 +213,16 @@ class GridworldEnvironment(environment.Environment):
 
     def reset(self):
         self.state = self.gridWorld.getStartState()
+        return self.state
+
+    def step_batch(self, states, actions, randObj=None):
+        nextStates, rewards, dones = [], [], []
+        for state, action in zip(states, actions):
+            nextState, reward = self.getRandomNextState(state, action, randObj)
+            nextStates.append(nextState)
+            rewards.append(reward)
+            dones.append(len(self.gridWorld.getPossibleActions(nextState)) == 0)
+        return nextStates, rewards, dones
 
 class Grid:
     """
@@ -311,6 +321,23 @@ def getMazeGrid():
             ['S',' ',' ',' ']]
     return Gridworld(grid)
 
+def getLargeGrid(size=40, seed=0):
+    """
+    A generated size x size maze for timing the value iteration agents:
+    random walls, an exit worth +1 in the top right corner and a few pits
+    worth -1.  The same seed always gives the same grid.
+    """
+    rand = random.Random(seed)
+    grid = [[' '] * size for row in range(size)]
+    for row in range(size):
+        for col in range(size):
+            if rand.random() < 0.2: grid[row][col] = '#'
+    for pit in range(size / 4):
+        grid[rand.randrange(size)][rand.randrange(size)] = -1
+    grid[0][size - 1] = +1
+    grid[size - 1][0] = 'S'
+    return Gridworld(grid)
+
 
 
 def getUserAction(state, actionFunction):
@@ -377,6 +404,30 @@ def runEpisode(agent, environment, discount, decision, display, message, pause,
     if 'stopEpisode' in dir(agent):
         agent.stopEpisode()
 
+def runQuietEpisode(agent, environment, discount):
+    """
+    Runs an episode like runEpisode without display, pause or message
+    callbacks, whose messages are built even when nobody reads them.
+    Returns the discounted return of the episode.
+    """
+    returns = 0
+    totalDiscount = 1.0
+    state = environment.reset()
+    if hasattr(agent, 'startEpisode'): agent.startEpisode()
+    observeTransition = getattr(agent, 'observeTransition', None)
+    done = len(environment.getPossibleActions(state)) == 0
+    while not done:
+        action = agent.getAction(state)
+        if action == None:
+            raise 'Error: Agent returned None action'
+        nextState, reward, done = environment.step(action)
+        if observeTransition != None:
+            observeTransition(state, action, nextState, reward)
+        returns += reward * totalDiscount
+        totalDiscount *= discount
+        state = nextState
+    return returns
+
 def parseOptions():
     optParser = optparse.OptionParser()
     optParser.add_option('-d', '--discount',action='store',
@@ -398,17 +449,23 @@ def parseOptions():
     optParser.add_option('-i', '--iterations',action='store',
                          type='int',dest='iters',default=10,
                          metavar="K", help='Number of rounds of value iteration (default %default)')
+    optParser.add_option('-b', '--backups',action='store',
+                         type='int',dest='backups',default=None,
+                         metavar="B", help='Maximum number of single-state backups of the async and prioritized agents, which stop earlier once converged (default 1000 per state)')
+    optParser.add_option('--theta',action='store',
+                         type='float',dest='theta',default=None,
+                         metavar="T", help='Bellman error threshold: theta of the prioritized agent, and the change below which the compiled and async agents stop early (default: the agent\'s own)')
     optParser.add_option('-k', '--episodes',action='store',
                          type='int',dest='episodes',default=1,
                          metavar="K", help='Number of epsiodes of the MDP to run (default %default)')
     optParser.add_option('-g', '--grid',action='store',
                          metavar="G", type='string',dest='grid',default="BookGrid",
-                         help='Grid to use (case sensitive; options are BookGrid, BridgeGrid, CliffGrid, MazeGrid, default %default)' )
+                         help='Grid to use (case sensitive; options are BookGrid, BridgeGrid, CliffGrid, MazeGrid, LargeGrid, default %default)' )
     optParser.add_option('-w', '--windowSize', metavar="X", type='int',dest='gridSize',default=150,
                          help='Request a window width of X pixels *per grid cell* (default %default)')
     optParser.add_option('-a', '--agent',action='store', metavar="A",
                          type='string',dest='agent',default="random",
-                         help='Agent type (options are \'random\', \'value\' and \'q\', default %default)')
+                         help='Agent type (options are \'random\', \'value\', \'compiled\', \'async\', \'prioritized\', \'policy\' and \'q\', default %default)')
     optParser.add_option('-t', '--text',action='store_true',
                          dest='textDisplay',default=False,
                          help='Use text-only ASCII display')
@@ -481,8 +538,34 @@ if __name__ == '__main__':
 
     import valueIterationAgents, qlearningAgents
     a = None
-    if opts.agent == 'value':
-        a = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, opts.iters)
+    valueAgents = {'value': valueIterationAgents.ValueIterationAgent,
+                   'compiled': valueIterationAgents.CompiledValueIterationAgent,
+                   'async': valueIterationAgents.AsynchronousValueIterationAgent,
+                   'prioritized': valueIterationAgents.PrioritizedSweepingValueIterationAgent,
+                   'policy': valueIterationAgents.PolicyIterationAgent}
+    # These agents count single-state backups instead of rounds of iteration
+    backupAgents = ['async', 'prioritized']
+    thresholdArgs = {'compiled': 'tolerance', 'async': 'tolerance', 'prioritized': 'theta'}
+    iterations, unit = opts.iters, 'ITERATIONS'
+    if opts.agent in backupAgents:
+        iterations, unit = opts.backups, 'BACKUPS'
+        if iterations == None:
+            # Enough for convergence on any grid; the agents stop once converged
+            iterations = 1000 * len(mdp.getStates())
+    def makeValueAgent(iterations):
+        args = {}
+        if opts.theta != None and opts.agent in thresholdArgs:
+            args[thresholdArgs[opts.agent]] = opts.theta
+        return valueAgents[opts.agent](mdp, opts.discount, iterations, **args)
+    if opts.agent in valueAgents:
+        a = makeValueAgent(iterations)
+        if hasattr(a, 'backups'):
+            print 'BELLMAN BACKUPS:', a.backups
+        if opts.agent in backupAgents:
+            # They stop early once the values have converged
+            iterations = a.backups
+        if hasattr(a, 'improvements'):
+            print 'POLICY IMPROVEMENTS:', a.improvements
     elif opts.agent == 'q':
         #env.getPossibleActions, opts.discount, opts.learningRate, opts.epsilon
         #simulationFn = lambda agent, state: simulation.GridworldSimulation(agent,state,mdp)
@@ -519,16 +602,16 @@ if __name__ == '__main__':
     ###########################
     # DISPLAY Q/V VALUES BEFORE SIMULATION OF EPISODES
     try:
-        if not opts.manual and opts.agent == 'value':
+        if not opts.manual and opts.agent in valueAgents:
             if opts.valueSteps:
-                for i in range(opts.iters):
-                    tempAgent = valueIterationAgents.ValueIterationAgent(mdp, opts.discount, i)
-                    display.displayValues(tempAgent, message = "VALUES AFTER "+str(i)+" ITERATIONS")
+                for i in range(iterations):
+                    tempAgent = makeValueAgent(i)
+                    display.displayValues(tempAgent, message = "VALUES AFTER "+str(i)+" "+unit)
                     display.pause()
 
-            display.displayValues(a, message = "VALUES AFTER "+str(opts.iters)+" ITERATIONS")
+            display.displayValues(a, message = "VALUES AFTER "+str(iterations)+" "+unit)
             display.pause()
-            display.displayQValues(a, message = "Q-VALUES AFTER "+str(opts.iters)+" ITERATIONS")
+            display.displayQValues(a, message = "Q-VALUES AFTER "+str(iterations)+" "+unit)
             display.pause()
     except KeyboardInterrupt:
         sys.exit(0)
@@ -542,7 +625,7 @@ if __name__ == '__main__':
             displayCallback = lambda state: display.displayNullValues(state)
         else:
             if opts.agent == 'random': displayCallback = lambda state: display.displayValues(a, state, "CURRENT VALUES")
-            if opts.agent == 'value': displayCallback = lambda state: display.displayValues(a, state, "CURRENT VALUES")
+            if opts.agent in valueAgents: displayCallback = lambda state: display.displayValues(a, state, "CURRENT VALUES")
             if opts.agent == 'q': displayCallback = lambda state: display.displayQValues(a, state, "CURRENT Q-VALUES")
 
     messageCallback = lambda x: printString(x)
@@ -567,7 +650,10 @@ if __name__ == '__main__':
         print
     returns = 0
     for episode in range(1, opts.episodes+1):
-        returns += runEpisode(a, env, opts.discount, decisionCallback, displayCallback, messageCallback, pauseCallback, episode)
+        if opts.quiet and not opts.manual:
+            returns += runQuietEpisode(a, env, opts.discount)
+        else:
+            returns += runEpisode(a, env, opts.discount, decisionCallback, displayCallback, messageCallback, pauseCallback, episode)
     if opts.episodes > 0:
         print
         print "AVERAGE RETURNS FROM START STATE: "+str((returns+0.0) / opts.episodes)
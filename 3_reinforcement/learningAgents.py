@@ -15,6 +15,7 @@
 from game import Directions, Agent, Actions
 
 import random,util,time
+import array, cPickle, struct
 
 class ValueEstimationAgent(Agent):
     """
@@ -256,3 +257,272 @@ class ReinforcementAgent(ValueEstimationAgent):
         if self.episodesSoFar == self.numTraining:
             msg = 'Training Done (turning off epsilon and alpha)'
             print '%s\n%s' % (msg,'-' * len(msg))
+
+def stateKey(state):
+    """
+    The key of state in a QTable.  A Pacman GameState is keyed by a compact
+    tuple holding everything its __eq__ compares: each agent's position,
+    direction and scared timer, the food (in the Grid.toBytes format), the
+    capsules and the score.  The key is built once per state and kept on its
+    data.  Any other state is its own key.
+    """
+    data = getattr(state, 'data', None)
+    if data == None or getattr(data, 'agentStates', None) == None:
+        return state
+    key = getattr(data, '_qTableKey', None)
+    if key == None:
+        agents = []
+        for agentState in data.agentStates:
+            conf = agentState.configuration
+            if conf == None:
+                agents.append((None, None, agentState.scaredTimer))
+            else:
+                agents.append((conf.pos, conf.direction, agentState.scaredTimer))
+        key = (tuple(agents), data.food.toBytes(), tuple(data.capsules), data.score)
+        data._qTableKey = key
+    return key
+
+class QTable:
+    """
+    The Q-values of a tabular learner.  States are interned to integer ids
+    through keyFn and actions to columns; each column is an array of the
+    Q-values of its action indexed by state id, and grows as new states are
+    seen.  Pairs never set are worth 0.0.
+    """
+    MAGIC = 'QTAB'
+    VERSION = 1
+
+    def __init__(self, keyFn=stateKey):
+        self.keyFn = keyFn
+        self.stateIds = {}
+        self.actionIds = {}
+        self.actions = []
+        self.columns = []
+
+    def getStateId(self, state, add=False):
+        "Returns the id of state, or None if it is new and add is False"
+        key = self.keyFn(state)
+        i = self.stateIds.get(key)
+        if i == None and add:
+            i = len(self.stateIds)
+            self.stateIds[key] = i
+            for column in self.columns:
+                column.append(0.0)
+        return i
+
+    def getActionId(self, action, add=False):
+        j = self.actionIds.get(action)
+        if j == None and add:
+            j = len(self.actions)
+            self.actionIds[action] = j
+            self.actions.append(action)
+            self.columns.append(array.array('d', [0.0] * len(self.stateIds)))
+        return j
+
+    def getQValue(self, state, action):
+        i = self.getStateId(state)
+        j = self.actionIds.get(action)
+        if i == None or j == None:
+            return 0.0
+        return self.columns[j][i]
+
+    def setQValue(self, state, action, value):
+        j = self.getActionId(action, True)
+        self.columns[j][self.getStateId(state, True)] = value
+
+    def getBest(self, state, actions):
+        """
+        Returns the largest Q-value of state over actions, and the first of
+        the actions that has it.  Returns (0.0, None) if actions is empty.
+        """
+        i = self.getStateId(state)
+        bestValue, bestAction = None, None
+        for action in actions:
+            j = self.actionIds.get(action)
+            if i == None or j == None:
+                value = 0.0
+            else:
+                value = self.columns[j][i]
+            if bestValue == None or value > bestValue:
+                bestValue, bestAction = value, action
+        if bestValue == None:
+            return 0.0, None
+        return bestValue, bestAction
+
+    def __len__(self):
+        return len(self.stateIds)
+
+    def save(self, path):
+        """
+        Writes the table to path: a header, the pickled state keys and
+        actions, then the raw Q-values of each action.  Pacman states are
+        stored as their compact stateKey tuples.
+        """
+        keys = [None] * len(self.stateIds)
+        for key, i in self.stateIds.items():
+            keys[i] = key
+        names = cPickle.dumps((keys, self.actions), 2)
+        f = open(path, 'wb')
+        try:
+            f.write(struct.pack('<4sIII', self.MAGIC, self.VERSION, len(names), len(keys)))
+            f.write(names)
+            for column in self.columns:
+                column.tofile(f)
+        finally:
+            f.close()
+
+    def load(path, keyFn=stateKey):
+        "Reads a QTable written by save"
+        f = open(path, 'rb')
+        try:
+            header = f.read(struct.calcsize('<4sIII'))
+            magic, version, namesLength, numStates = struct.unpack('<4sIII', header)
+            if magic != QTable.MAGIC or version != QTable.VERSION:
+                raise Exception('%s is not a version %d Q-table file' % (path, QTable.VERSION))
+            keys, actions = cPickle.loads(f.read(namesLength))
+            table = QTable(keyFn)
+            for i, key in enumerate(keys):
+                table.stateIds[key] = i
+            for action in actions:
+                table.actionIds[action] = len(table.actions)
+                table.actions.append(action)
+                column = array.array('d')
+                column.fromfile(f, numStates)
+                table.columns.append(column)
+        finally:
+            f.close()
+        return table
+    load = staticmethod(load)
+
+def bitIndices(mask):
+    "Returns the positions of the bits set in mask, lowest first"
+    indices = []
+    i = 0
+    while mask:
+        if mask & 1: indices.append(i)
+        mask >>= 1
+        i += 1
+    return indices
+
+class ReplayBuffer:
+    """
+    A fixed-capacity ring of transitions kept in preallocated arrays, so its
+    memory does not depend on the size of the states.  A transition is the
+    id of its state and action, its reward, the id of the next state, a
+    bitmask of the ids of the actions legal there and whether the episode
+    ended, plus optionally up to numVectors feature vectors of at most
+    width entries each.  Once full, the oldest transition is overwritten.
+
+    With prioritized=True transitions are sampled in proportion to
+    priority ** alpha, where the priority of a transition is its last TD
+    error (new ones get the largest seen so far); a sum tree over the slots
+    makes sampling and updates O(log capacity).
+    """
+    def __init__(self, capacity, prioritized=False, numVectors=0, width=0, alpha=0.6, beta=1.0):
+        self.capacity = capacity
+        self.prioritized = prioritized
+        self.numVectors = numVectors
+        self.width = width
+        self.alpha = alpha
+        self.beta = beta
+        self.size = 0
+        self.next = 0
+        self.stateIds = array.array('i', [0]) * capacity
+        self.actionIds = array.array('i', [0]) * capacity
+        self.rewards = array.array('d', [0.0]) * capacity
+        self.nextStateIds = array.array('i', [0]) * capacity
+        self.nextActions = array.array('L', [0]) * capacity
+        self.dones = array.array('b', [0]) * capacity
+        self.featureIndices = array.array('i', [-1]) * (capacity * numVectors * width)
+        self.featureValues = array.array('d', [0.0]) * (capacity * numVectors * width)
+        if prioritized:
+            self.tree = array.array('d', [0.0]) * (2 * capacity)
+            self.maxPriority = 1.0
+
+    def add(self, stateId, actionId, reward, nextStateId, nextActions, done, vectors=()):
+        """
+        Stores a transition, overwriting the oldest one if the buffer is
+        full, and returns its slot.  vectors is a sequence of (indices,
+        values) pairs as returned by FeatureIndex.vectorize.
+        """
+        if len(vectors) > self.numVectors:
+            raise Exception('A transition can store at most %d feature vectors' % self.numVectors)
+        slot = self.next
+        self.stateIds[slot] = stateId
+        self.actionIds[slot] = actionId
+        self.rewards[slot] = reward
+        self.nextStateIds[slot] = nextStateId
+        self.nextActions[slot] = nextActions
+        self.dones[slot] = done
+        for k in range(self.numVectors):
+            start = (slot * self.numVectors + k) * self.width
+            indices, values = [], []
+            if k < len(vectors):
+                indices, values = vectors[k]
+            if len(indices) > self.width:
+                raise Exception('Feature vector has more than %d entries' % self.width)
+            for n in range(self.width):
+                if n < len(indices):
+                    self.featureIndices[start + n] = indices[n]
+                    self.featureValues[start + n] = values[n]
+                else:
+                    self.featureIndices[start + n] = -1
+        if self.prioritized:
+            self.setPriority(slot, self.maxPriority)
+        self.next = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return slot
+
+    def getVector(self, slot, k):
+        "Returns feature vector k of the transition in slot as (indices, values)"
+        start = (slot * self.numVectors + k) * self.width
+        indices, values = [], []
+        for n in range(start, start + self.width):
+            if self.featureIndices[n] < 0: break
+            indices.append(self.featureIndices[n])
+            values.append(self.featureValues[n])
+        return indices, values
+
+    def sample(self, batchSize, randObj=random):
+        """
+        Returns batchSize (slot, weight) pairs drawn with replacement.  The
+        weights are 1.0 for uniform sampling; for prioritized sampling they
+        are importance-sampling corrections, scaled so the largest is 1.0.
+        """
+        if self.size == 0:
+            return []
+        if not self.prioritized:
+            return [(randObj.randrange(self.size), 1.0) for i in range(batchSize)]
+        total = self.tree[1]
+        slots = [self.findSlot(randObj.random() * total) for i in range(batchSize)]
+        weights = [(self.size * self.tree[self.capacity + slot] / total) ** -self.beta for slot in slots]
+        largest = max(weights)
+        return [(slot, weight / largest) for slot, weight in zip(slots, weights)]
+
+    def updatePriority(self, slot, error):
+        if not self.prioritized: return
+        priority = (abs(error) + 1e-6) ** self.alpha
+        self.maxPriority = max(self.maxPriority, priority)
+        self.setPriority(slot, priority)
+
+    def setPriority(self, slot, priority):
+        i = self.capacity + slot
+        change = priority - self.tree[i]
+        while i >= 1:
+            self.tree[i] += change
+            i /= 2
+
+    def findSlot(self, mass):
+        "Returns the slot where the running sum of the priorities passes mass"
+        tree, i = self.tree, 1
+        while i < self.capacity:
+            left = 2 * i
+            if mass < tree[left] or tree[left + 1] <= 0:
+                i = left
+            else:
+                mass -= tree[left]
+                i = left + 1
+        return i - self.capacity
+
+    def __len__(self):
+        return self.size
@@ -13,6 +13,8 @@
 
 
 import random
+import array
+import util
 
 class MarkovDecisionProcess:
 
@@ -65,3 +67,296 @@ class MarkovDecisionProcess:
         are equivalent.
         """
         abstract
+
+class CompiledMDP:
+    """
+    A MarkovDecisionProcess read into flat arrays once, so that Bellman
+    backups need no calls into the mdp and no dictionary lookups.
+
+    States are numbered in the order of mdp.getStates(), followed by any
+    state that is only reached through transitions.  The actions of state i
+    are rows firstRow[i] to firstRow[i+1]-1, in the order of
+    getPossibleActions, and the transitions of row r are entries
+    firstTransition[r] to firstTransition[r+1]-1 of nextStates, probs and
+    rewards.  Terminal states and states without actions have no rows.
+    """
+    def __init__(self, mdp):
+        self.mdp = mdp
+        self.states = list(mdp.getStates())
+        self.stateIndex = dict((state, i) for i, state in enumerate(self.states))
+        self.firstRow = array.array('i', [0])
+        self.rowActions = []
+        self.firstTransition = array.array('i', [0])
+        self.nextStates = array.array('i')
+        self.probs = array.array('d')
+        self.rewards = array.array('d')
+        self.predecessors = None
+
+        i = 0
+        while i < len(self.states):
+            state = self.states[i]
+            if not mdp.isTerminal(state):
+                for action in mdp.getPossibleActions(state):
+                    for nextState, prob in mdp.getTransitionStatesAndProbs(state, action):
+                        if nextState not in self.stateIndex:
+                            self.stateIndex[nextState] = len(self.states)
+                            self.states.append(nextState)
+                        self.nextStates.append(self.stateIndex[nextState])
+                        self.probs.append(prob)
+                        self.rewards.append(mdp.getReward(state, action, nextState))
+                    self.rowActions.append(action)
+                    self.firstTransition.append(len(self.nextStates))
+            self.firstRow.append(len(self.rowActions))
+            i += 1
+
+    def backup(self, values, discount, i):
+        """
+        Returns the Q-values of the actions of state i, given the value
+        of each state in the sequence values.
+        """
+        nextStates, probs, rewards = self.nextStates, self.probs, self.rewards
+        firstTransition = self.firstTransition
+        qValues = []
+        for row in range(self.firstRow[i], self.firstRow[i+1]):
+            q = 0.0
+            for t in range(firstTransition[row], firstTransition[row+1]):
+                q += probs[t] * (rewards[t] + discount * values[nextStates[t]])
+            qValues.append(q)
+        return qValues
+
+    def valueIteration(self, discount, iterations=100, tolerance=0.0, values=None):
+        """
+        Runs batch value iteration from values (all zero by default) for at
+        most iterations sweeps, stopping early once no value changes by
+        more than tolerance.  Returns the values as an array indexed like
+        self.states and the number of sweeps run.
+        """
+        n = len(self.states)
+        if values == None:
+            values = array.array('d', [0.0] * n)
+        firstRow, firstTransition = self.firstRow, self.firstTransition
+        nextStates, probs, rewards = self.nextStates, self.probs, self.rewards
+        sweeps = 0
+        while sweeps < iterations:
+            newValues = array.array('d', values)
+            change = 0.0
+            for i in xrange(n):
+                if firstRow[i] == firstRow[i+1]: continue
+                # The same backup as self.backup, inlined
+                best = None
+                for row in xrange(firstRow[i], firstRow[i+1]):
+                    q = 0.0
+                    for t in xrange(firstTransition[row], firstTransition[row+1]):
+                        q += probs[t] * (rewards[t] + discount * values[nextStates[t]])
+                    if best == None or q > best:
+                        best = q
+                newValues[i] = best
+                change = max(change, abs(best - values[i]))
+            values = newValues
+            sweeps += 1
+            if change <= tolerance: break
+        return values, sweeps
+
+    def getPredecessors(self):
+        """
+        Returns, for each state index, the set of indices of the states
+        that reach it with nonzero probability under some action.
+        """
+        if self.predecessors == None:
+            self.predecessors = [set() for state in self.states]
+            for i in range(len(self.states)):
+                start = self.firstTransition[self.firstRow[i]]
+                end = self.firstTransition[self.firstRow[i+1]]
+                for t in range(start, end):
+                    if self.probs[t] > 0:
+                        self.predecessors[self.nextStates[t]].add(i)
+        return self.predecessors
+
+    def numActiveStates(self):
+        "Number of states with at least one action, i.e. backups per sweep"
+        firstRow = self.firstRow
+        return len([i for i in range(len(self.states)) if firstRow[i] < firstRow[i+1]])
+
+    def cyclicValueIteration(self, discount, iterations=1000, tolerance=0.0, values=None):
+        """
+        Runs in-place value iteration that backs up one state per
+        iteration, cycling through the states that have actions.  Each
+        backup sees the values written by the ones before it.  Stops after
+        iterations backups, or once a whole cycle changes no value by more
+        than tolerance.  Returns the values and the number of backups.
+        """
+        if values == None:
+            values = array.array('d', [0.0] * len(self.states))
+        active = [i for i in range(len(self.states)) if self.firstRow[i] < self.firstRow[i+1]]
+        backups = 0
+        change = 0.0
+        while backups < iterations and len(active) > 0:
+            i = active[backups % len(active)]
+            best = max(self.backup(values, discount, i))
+            change = max(change, abs(best - values[i]))
+            values[i] = best
+            backups += 1
+            if backups % len(active) == 0:
+                if change <= tolerance: break
+                change = 0.0
+        return values, backups
+
+    def prioritizedSweeping(self, discount, iterations=100, theta=1e-5, values=None):
+        """
+        Runs prioritized sweeping: states are backed up in order of their
+        Bellman error, largest first, and a backup only puts back on the
+        queue the predecessors whose error now exceeds theta.  Stops after
+        iterations backups or when no state has an error above theta.
+        Returns the values and the number of backups.
+        """
+        if values == None:
+            values = array.array('d', [0.0] * len(self.states))
+        predecessors = self.getPredecessors()
+        firstRow = self.firstRow
+
+        def error(i):
+            return abs(values[i] - max(self.backup(values, discount, i)))
+
+        queue = util.PriorityQueue()
+        for i in range(len(self.states)):
+            if firstRow[i] < firstRow[i+1]:
+                queue.push(i, -error(i))
+        backups = 0
+        while backups < iterations and not queue.isEmpty():
+            i = queue.pop()
+            # A state can be queued more than once; skip stale entries
+            if error(i) <= theta: continue
+            values[i] = max(self.backup(values, discount, i))
+            backups += 1
+            for p in predecessors[i]:
+                if firstRow[p] == firstRow[p+1]: continue
+                diff = error(p)
+                if diff > theta:
+                    queue.push(p, -diff)
+        return values, backups
+
+    def policyEvaluation(self, policy, discount, sweeps=None, values=None):
+        """
+        Returns the values of following policy, an array giving the row of
+        the chosen action of each state (-1 for states without actions),
+        together with the largest change made by the last sweep.
+
+        With sweeps=None the linear system (I - discount * P) v = r is
+        solved exactly by sparse Gaussian elimination.  Otherwise that many
+        in-place sweeps are run from values (modified policy iteration).
+        """
+        n = len(self.states)
+        firstTransition = self.firstTransition
+        nextStates, probs, rewards = self.nextStates, self.probs, self.rewards
+        if sweeps != None:
+            if values == None:
+                values = array.array('d', [0.0] * n)
+            change = 0.0
+            for sweep in range(sweeps):
+                change = 0.0
+                for i in xrange(n):
+                    row = policy[i]
+                    if row < 0: continue
+                    v = 0.0
+                    for t in xrange(firstTransition[row], firstTransition[row+1]):
+                        v += probs[t] * (rewards[t] + discount * values[nextStates[t]])
+                    change = max(change, abs(v - values[i]))
+                    values[i] = v
+            return values, change
+
+        # Row i of the system as a dict from column to coefficient, and the
+        # rows that have an entry in each column, to find what to eliminate
+        rows = [{i: 1.0} for i in range(n)]
+        columns = [set([i]) for i in range(n)]
+        rhs = [0.0] * n
+        for i in range(n):
+            row = policy[i]
+            if row < 0: continue
+            for t in range(firstTransition[row], firstTransition[row+1]):
+                j = nextStates[t]
+                rows[i][j] = rows[i].get(j, 0.0) - discount * probs[t]
+                columns[j].add(i)
+                rhs[i] += probs[t] * rewards[t]
+        for i in range(n):
+            pivotRow = rows[i]
+            pivot = pivotRow[i]
+            if abs(pivot) < 1e-12:
+                raise Exception('The policy never terminates; use a discount below 1 or sweeps')
+            for k in columns[i]:
+                if k <= i: continue
+                factor = rows[k].pop(i) / pivot
+                for j, coefficient in pivotRow.items():
+                    if j == i: continue
+                    rows[k][j] = rows[k].get(j, 0.0) - factor * coefficient
+                    columns[j].add(k)
+                rhs[k] -= factor * rhs[i]
+        values = array.array('d', [0.0] * n)
+        for i in range(n - 1, -1, -1):
+            total = rhs[i]
+            for j, coefficient in rows[i].items():
+                if j != i: total -= coefficient * values[j]
+            values[i] = total / rows[i][i]
+        return values, 0.0
+
+    def policyImprovement(self, values, discount, policy):
+        """
+        Makes policy greedy with respect to values, in place, keeping the
+        current action wherever it is already among the best.  Returns
+        whether the policy is unchanged.
+        """
+        stable = True
+        for i in range(len(self.states)):
+            if policy[i] < 0: continue
+            start = self.firstRow[i]
+            qValues = self.backup(values, discount, i)
+            best = max(qValues)
+            current = qValues[policy[i] - start]
+            # Ignore gains within rounding error, or ties can cycle forever
+            if current < best - 1e-12 * abs(best):
+                policy[i] = start + qValues.index(best)
+                stable = False
+        return stable
+
+    def policyIteration(self, discount, iterations=100, sweeps=None, tolerance=1e-6):
+        """
+        Alternates policy evaluation and greedy improvement, starting from
+        the first action of every state, until the policy is stable (and,
+        with sweeps, the last evaluation sweep changed no value by more
+        than tolerance) or iterations improvements have been made.
+        Returns the values, the policy and the number of improvements.
+        """
+        n = len(self.states)
+        policy = array.array('i', [-1] * n)
+        for i in range(n):
+            if self.firstRow[i] < self.firstRow[i+1]:
+                policy[i] = self.firstRow[i]
+        values = array.array('d', [0.0] * n)
+        improvements = 0
+        while improvements < iterations:
+            values, change = self.policyEvaluation(policy, discount, sweeps, values)
+            stable = self.policyImprovement(values, discount, policy)
+            improvements += 1
+            if stable and change <= tolerance: break
+        return values, policy, improvements
+
+    def getQValue(self, values, discount, state, action):
+        i = self.stateIndex[state]
+        for row, q in zip(range(self.firstRow[i], self.firstRow[i+1]), self.backup(values, discount, i)):
+            if self.rowActions[row] == action:
+                return q
+        raise Exception('Illegal action ' + str(action) + ' in ' + str(state))
+
+    def getPolicy(self, values, discount, state):
+        "Returns the first best action of state, or None if it has none"
+        i = self.stateIndex[state]
+        qValues = self.backup(values, discount, i)
+        if len(qValues) == 0:
+            return None
+        return self.rowActions[self.firstRow[i] + qValues.index(max(qValues))]
+
+    def toCounter(self, values):
+        "Maps values indexed like self.states back to a Counter keyed by state"
+        counter = util.Counter()
+        for state, value in zip(self.states, values):
+            counter[state] = value
+        return counter
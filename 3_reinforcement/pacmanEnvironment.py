@@ -0,0 +1,349 @@
+# pacmanEnvironment.py
+# --------------------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"Pacman as a batched reinforcement learning environment"
+
+from game import Directions, Actions, Configuration, BitGrid
+from pacman import GameState, SCARED_TIME, COLLISION_TOLERANCE, TIME_PENALTY
+import environment
+import array
+import random
+
+class PacmanEnvironment(environment.Environment):
+    """
+      One game of Pacman as an Environment whose states are GameStates.  An
+      action is Pacman's move followed by the ghosts' replies, rewarded with
+      the change of score.  See VectorPacmanEnv to play many games at once.
+    """
+
+    def __init__(self, layout, ghostAgents):
+        self.layout = layout
+        self.ghostAgents = ghostAgents[:layout.getNumGhosts()]
+        self.reset()
+
+    def getCurrentState(self):
+        return self.state
+
+    def getPossibleActions(self, state):
+        return state.getLegalActions(0)
+
+    def doAction(self, action):
+        state = self.state
+        self.state = self.getNextState(state, action)
+        return self.state, self.state.getScore() - state.getScore()
+
+    def getNextState(self, state, action):
+        state = state.generateSuccessor(0, action)
+        for ghost in self.ghostAgents:
+            if state.isWin() or state.isLose(): break
+            state = state.generateSuccessor(ghost.index, ghost.getAction(state))
+        return state
+
+    def reset(self):
+        self.state = GameState()
+        self.state.initialize(self.layout, len(self.ghostAgents))
+        return self.state
+
+    def step_batch(self, states, actions):
+        nextStates, rewards, dones = [], [], []
+        for state, action in zip(states, actions):
+            nextState = self.getNextState(state, action)
+            nextStates.append(nextState)
+            rewards.append(nextState.getScore() - state.getScore())
+            dones.append(nextState.isWin() or nextState.isLose())
+        return nextStates, rewards, dones
+
+class VectorPacmanEnv:
+    """
+      Plays numGames independent games of classic Pacman on one layout in
+      lockstep, without the Game machinery.  The rules are those of
+      pacman.PacmanRules and pacman.GhostRules, and the ghosts move like
+      ghostAgents.RandomGhost or ghostAgents.DirectionalGhost.
+
+      The games are stored by field rather than as GameStates: positions and
+      timers in flat arrays (ghost coordinates in half cells, since scared
+      ghosts move at half speed), and food and capsules as one integer
+      bitmask per game, with cell (x,y) in bit x * height + y like a BitGrid.
+      Legal moves are looked up in tables built once for the layout.
+
+      A step plays one round of every game: Pacman's action, then each ghost
+      in turn.  Games that end are started over at once, so every step takes
+      one action per game.
+
+        env = VectorPacmanEnv(layout.getLayout('smallClassic'), 64)
+        observations = env.reset()
+        actions = [random.choice(env.getLegalActions(k)) for k in range(64)]
+        observations, rewards, dones = env.step(actions)
+    """
+    GHOST_TYPES = ('RandomGhost', 'DirectionalGhost')
+
+    def __init__(self, layout, numGames, ghostType='RandomGhost', numGhosts=None,
+                 prob_attack=0.8, prob_scaredFlee=0.8, seed=None):
+        if ghostType not in self.GHOST_TYPES:
+            raise Exception('Unknown ghost type: ' + str(ghostType))
+        if numGhosts == None:
+            numGhosts = layout.getNumGhosts()
+        self.layout = layout
+        self.numGames = numGames
+        self.ghostType = ghostType
+        self.prob_attack = prob_attack
+        self.prob_scaredFlee = prob_scaredFlee
+        self.random = random.Random(seed)
+
+        # The start of every game, as GameState.initialize sets it up
+        start = GameState()
+        start.initialize(layout, numGhosts)
+        agentStates = start.data.agentStates
+        self.numGhosts = len(agentStates) - 1
+        self.pacmanStart = agentStates[0].start.pos
+        self.ghostStarts = [(int(2 * s.start.pos[0]), int(2 * s.start.pos[1]), s.start.direction)
+                            for s in agentStates[1:]]
+        self.startFood = BitGrid.fromGrid(layout.food).bits
+        self.startNumFood = layout.food.count()
+        self.startCapsules = 0
+        for x, y in layout.capsules:
+            self.startCapsules |= 1 << (x * layout.height + y)
+
+        self._buildMoveTables(layout.walls)
+
+        K, G = numGames, self.numGhosts
+        self.pacmanX = array.array('i', [0] * K)
+        self.pacmanY = array.array('i', [0] * K)
+        self.pacmanDirection = [Directions.STOP] * K
+        self.ghostX = array.array('i', [0] * (K * G))
+        self.ghostY = array.array('i', [0] * (K * G))
+        self.ghostDirection = [Directions.STOP] * (K * G)
+        self.scaredTimers = array.array('i', [0] * (K * G))
+        self.food = [0] * K
+        self.numFood = array.array('i', [0] * K)
+        self.capsules = [0] * K
+        self.scores = array.array('i', [0] * K)
+        self.episodeScores = []
+        self.wins = 0
+
+    def _buildMoveTables(self, walls):
+        """
+          pacmanActions[x][y] lists the legal actions of Pacman on cell (x,y)
+          and ghostActions[x][y][direction] those of a ghost that reached it
+          heading in direction, in the order Actions.getPossibleActions uses.
+        """
+        self.pacmanActions = [[None] * walls.height for x in range(walls.width)]
+        self.ghostActions = [[None] * walls.height for x in range(walls.width)]
+        for x in range(walls.width):
+            for y in range(walls.height):
+                if walls[x][y]: continue
+                possible = [dir for dir, (dx, dy) in Actions._directionsAsList
+                            if not walls[x + dx][y + dy]]
+                self.pacmanActions[x][y] = possible
+                moves = [dir for dir in possible if dir != Directions.STOP]
+                self.ghostActions[x][y] = {}
+                for direction in Actions._directions:
+                    reverse = Actions.reverseDirection(direction)
+                    if reverse in moves and len(moves) > 1:
+                        self.ghostActions[x][y][direction] = [dir for dir in moves if dir != reverse]
+                    else:
+                        self.ghostActions[x][y][direction] = moves
+
+    def reset(self):
+        "Starts every game over and returns their observations"
+        for k in range(self.numGames):
+            self.resetGame(k)
+        return [self.getObservation(k) for k in range(self.numGames)]
+
+    def resetGame(self, k):
+        self.pacmanX[k], self.pacmanY[k] = self.pacmanStart
+        self.pacmanDirection[k] = Directions.STOP
+        G = self.numGhosts
+        for i in range(G):
+            g = k * G + i
+            self.ghostX[g], self.ghostY[g], self.ghostDirection[g] = self.ghostStarts[i]
+            self.scaredTimers[g] = 0
+        self.food[k] = self.startFood
+        self.numFood[k] = self.startNumFood
+        self.capsules[k] = self.startCapsules
+        self.scores[k] = 0
+
+    def getLegalActions(self, k):
+        "Pacman's legal actions in game k"
+        return self.pacmanActions[self.pacmanX[k]][self.pacmanY[k]][:]
+
+    def getObservation(self, k):
+        """
+          Returns game k as a hashable tuple: Pacman's position, the ghosts'
+          positions, the food and capsule bitmasks and the ghosts' scared
+          timers.
+        """
+        G = self.numGhosts
+        ghosts = range(k * G, k * G + G)
+        return ((self.pacmanX[k], self.pacmanY[k]),
+                tuple([(self.ghostX[g] / 2.0, self.ghostY[g] / 2.0) for g in ghosts]),
+                self.food[k], self.capsules[k],
+                tuple([self.scaredTimers[g] for g in ghosts]))
+
+    def getGameState(self, k):
+        """
+          Returns game k as a pacman.GameState, for agents and feature
+          extractors written against GameStates.  Slower than getObservation.
+        """
+        state = GameState()
+        state.initialize(self.layout, self.numGhosts)
+        data = state.data
+        pacmanState = data.agentStates[0]
+        pacmanState.configuration = Configuration((self.pacmanX[k], self.pacmanY[k]), self.pacmanDirection[k])
+        G = self.numGhosts
+        for i in range(G):
+            g = k * G + i
+            ghostState = data.agentStates[i + 1]
+            ghostState.configuration = Configuration((self.ghostX[g] / 2.0, self.ghostY[g] / 2.0),
+                                                     self.ghostDirection[g])
+            ghostState.scaredTimer = self.scaredTimers[g]
+        width, height = self.layout.width, self.layout.height
+        data.food = BitGrid(width, height, self.food[k]).toGrid()
+        data.capsules = [(x, y) for x, y in self.layout.capsules
+                         if self.capsules[k] >> (x * height + y) & 1]
+        data.score = self.scores[k]
+        data._zobrist = None
+        return state
+
+    def step(self, actions):
+        """
+          Plays one round of every game, Pacman taking actions[k] in game k.
+          Returns the observation of each game, the change of its score over
+          the round and whether the round ended it.  Games that ended are
+          reset, so their observation is that of the start of the next game;
+          their final scores are appended to episodeScores.
+        """
+        observations, rewards, dones = [], [], []
+        for k in range(self.numGames):
+            reward, done = self._playRound(k, actions[k])
+            if done:
+                self.episodeScores.append(self.scores[k])
+                self.resetGame(k)
+            observations.append(self.getObservation(k))
+            rewards.append(reward)
+            dones.append(done)
+        return observations, rewards, dones
+
+    def _playRound(self, k, action):
+        "Plays one round of game k and returns its score change and whether it ended"
+        x, y = self.pacmanX[k], self.pacmanY[k]
+        if action not in self.pacmanActions[x][y]:
+            raise Exception("Illegal action " + str(action))
+        dx, dy = Actions._directions[action]
+        x += dx
+        y += dy
+        self.pacmanX[k], self.pacmanY[k] = x, y
+        if action != Directions.STOP:
+            self.pacmanDirection[k] = action
+
+        G = self.numGhosts
+        first = k * G
+        scoreChange = 0
+        win, lose = False, False
+
+        # Eat
+        bit = 1 << (x * self.layout.height + y)
+        if self.food[k] & bit:
+            scoreChange += 10
+            self.food[k] ^= bit
+            self.numFood[k] -= 1
+            if self.numFood[k] == 0:
+                scoreChange += 500
+                win = True
+        if self.capsules[k] & bit:
+            self.capsules[k] ^= bit
+            for g in range(first, first + G):
+                self.scaredTimers[g] = SCARED_TIME
+        scoreChange -= TIME_PENALTY
+
+        # Anyone can kill Pacman after he moves
+        for g in range(first, first + G):
+            scoreChange, lose = self._checkDeath(g, x, y, scoreChange, win, lose)
+
+        # Ghosts move until the game is over
+        for g in range(first, first + G):
+            if win or lose: break
+            scoreChange, lose = self._moveGhost(g, x, y, scoreChange, win, lose)
+
+        self.scores[k] += scoreChange
+        if win: self.wins += 1
+        return scoreChange, win or lose
+
+    def _moveGhost(self, g, pacmanX, pacmanY, scoreChange, win, lose):
+        gx, gy, direction = self.ghostX[g], self.ghostY[g], self.ghostDirection[g]
+        scared = self.scaredTimers[g]
+        if gx & 1 or gy & 1:
+            # In between grid points, ghosts must continue straight
+            legal = [direction]
+        else:
+            legal = self.ghostActions[gx >> 1][gy >> 1][direction]
+        speed = 1 if scared > 0 else 2
+        action = self._chooseGhostAction(legal, gx, gy, speed, scared > 0, pacmanX, pacmanY)
+        dx, dy = Actions._directions[action]
+        gx += dx * speed
+        gy += dy * speed
+        self.ghostDirection[g] = action
+
+        # Time passes: a ghost that stops being scared snaps to the grid
+        if scared == 1:
+            gx += gx & 1
+            gy += gy & 1
+        self.scaredTimers[g] = max(0, scared - 1)
+        self.ghostX[g], self.ghostY[g] = gx, gy
+        return self._checkDeath(g, pacmanX, pacmanY, scoreChange, win, lose)
+
+    def _chooseGhostAction(self, legal, gx, gy, speed, isScared, pacmanX, pacmanY):
+        """
+          Samples a ghost action from the distribution GhostAgent.getAction
+          would, drawing one random number per move like util.sample.
+        """
+        actions = sorted(legal)
+        n = len(actions)
+        if self.ghostType == 'RandomGhost':
+            probabilities = [1.0 / n] * n
+        else:
+            px, py = 2 * pacmanX, 2 * pacmanY
+            distances = [abs(gx + dx * speed - px) + abs(gy + dy * speed - py)
+                         for dx, dy in [Actions._directions[a] for a in actions]]
+            if isScared:
+                bestScore, bestProb = max(distances), self.prob_scaredFlee
+            else:
+                bestScore, bestProb = min(distances), self.prob_attack
+            numBest = distances.count(bestScore)
+            probabilities = [(1 - bestProb) / n + (bestProb / numBest if d == bestScore else 0)
+                             for d in distances]
+            total = float(sum(probabilities))
+            probabilities = [p / total for p in probabilities]
+        if sum(probabilities) != 1:
+            total = float(sum(probabilities))
+            probabilities = [p / total for p in probabilities]
+        choice = self.random.random()
+        i, total = 0, probabilities[0]
+        while choice > total and i < n - 1:
+            i += 1
+            total += probabilities[i]
+        return actions[i]
+
+    def _checkDeath(self, g, pacmanX, pacmanY, scoreChange, win, lose):
+        "Resolves a collision between Pacman and ghost g, if they are close enough"
+        if abs(self.ghostX[g] - 2 * pacmanX) + abs(self.ghostY[g] - 2 * pacmanY) > 2 * COLLISION_TOLERANCE:
+            return scoreChange, lose
+        if self.scaredTimers[g] > 0:
+            scoreChange += 200
+            self.ghostX[g], self.ghostY[g], self.ghostDirection[g] = self.ghostStarts[g % self.numGhosts]
+            self.scaredTimers[g] = 0
+        elif not win:
+            scoreChange -= 500
+            lose = True
+        return scoreChange, lose
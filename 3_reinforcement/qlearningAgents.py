@@ -13,10 +13,12 @@
 
 
 from game import *
-from learningAgents import ReinforcementAgent
+from learningAgents import ReinforcementAgent, QTable, ReplayBuffer, bitIndices
 from featureExtractors import *
 
 import random,util,math
+import array
+import os
 
 class QLearningAgent(ReinforcementAgent):
     """
@@ -38,11 +40,26 @@ class QLearningAgent(ReinforcementAgent):
         - self.getLegalActions(state)
           which returns legal actions for a state
     """
-    def __init__(self, **args):
-        "You can initialize Q-values here..."
+    def __init__(self, replaySize=0, replay='uniform', batchSize=8, qTable=None, **args):
+        """
+        replaySize - if positive, keep this many past transitions and
+                     replay a minibatch of them after every update
+        replay     - 'uniform' or 'prioritized' (by TD error) sampling
+        batchSize  - number of transitions replayed per update
+        qTable     - a Q-table file (see QTable.save) to start from if it
+                     exists, and to save the table to when training ends
+        """
         ReinforcementAgent.__init__(self, **args)
 
-        "*** YOUR CODE HERE ***"
+        self.qValues = QTable()
+        self.qTableFile = qTable
+        if qTable != None and os.path.exists(qTable):
+            self.qValues = QTable.load(qTable)
+            print 'Loaded %d states from %s' % (len(self.qValues), qTable)
+        self.batchSize = int(batchSize)
+        self.replay = None
+        if int(replaySize) > 0:
+            self.replay = self.newReplayBuffer(int(replaySize), replay == 'prioritized')
 
     def getQValue(self, state, action):
         """
@@ -50,8 +67,7 @@ class QLearningAgent(ReinforcementAgent):
           Should return 0.0 if we have never seen a state
           or the Q node value otherwise
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        return self.qValues.getQValue(state, action)
 
 
     def computeValueFromQValues(self, state):
@@ -61,8 +77,7 @@ class QLearningAgent(ReinforcementAgent):
           there are no legal actions, which is the case at the
           terminal state, you should return a value of 0.0.
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        return self.getBestQValue(state)[0]
 
     def computeActionFromQValues(self, state):
         """
@@ -70,8 +85,14 @@ class QLearningAgent(ReinforcementAgent):
           are no legal actions, which is the case at the terminal state,
           you should return None.
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        return self.getBestQValue(state)[1]
+
+    def getBestQValue(self, state):
+        """
+          Returns the largest Q-value over the legal actions of state and
+          the first action with it, or (0.0, None) if there are none.
+        """
+        return self.qValues.getBest(state, self.getLegalActions(state))
 
     def getAction(self, state):
         """
@@ -87,8 +108,12 @@ class QLearningAgent(ReinforcementAgent):
         # Pick Action
         legalActions = self.getLegalActions(state)
         action = None
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        if len(legalActions) == 0:
+            return action
+        if util.flipCoin(self.epsilon):
+            action = random.choice(legalActions)
+        else:
+            action = self.computeActionFromQValues(state)
 
         return action
 
@@ -101,8 +126,51 @@ class QLearningAgent(ReinforcementAgent):
           NOTE: You should never call this function,
           it will be called on your behalf
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        sample = reward + self.discount * self.computeValueFromQValues(nextState)
+        qValue = self.qValues.getQValue(state, action)
+        self.qValues.setQValue(state, action, qValue + self.alpha * (sample - qValue))
+        if self.replay != None and self.alpha > 0:
+            self.remember(state, action, nextState, reward)
+            self.replayMinibatch()
+
+    def newReplayBuffer(self, capacity, prioritized):
+        return ReplayBuffer(capacity, prioritized)
+
+    def remember(self, state, action, nextState, reward):
+        "Stores a transition in the replay buffer by state and action ids"
+        table = self.qValues
+        nextActions = 0
+        for nextAction in self.getLegalActions(nextState):
+            nextActions |= 1 << table.getActionId(nextAction, True)
+        self.replay.add(table.getStateId(state, True), table.getActionId(action, True), reward,
+                        table.getStateId(nextState, True), nextActions, nextActions == 0)
+
+    def replayMinibatch(self):
+        for slot, weight in self.replay.sample(self.batchSize):
+            self.replay.updatePriority(slot, self.replayTransition(slot, weight))
+
+    def replayTransition(self, slot, weight):
+        """
+          Repeats the Q-value update of the transition in the given slot
+          of the replay buffer, with the learning rate scaled by weight,
+          and returns its TD error.
+        """
+        replay, columns = self.replay, self.qValues.columns
+        stateId, actionId = replay.stateIds[slot], replay.actionIds[slot]
+        sample = replay.rewards[slot]
+        if not replay.dones[slot]:
+            nextStateId = replay.nextStateIds[slot]
+            sample += self.discount * max([columns[j][nextStateId] for j in bitIndices(replay.nextActions[slot])])
+        error = sample - columns[actionId][stateId]
+        columns[actionId][stateId] += self.alpha * weight * error
+        return error
+
+    def final(self, state):
+        "Called at the end of each game; saves the Q-table when training ends"
+        ReinforcementAgent.final(self, state)
+        if self.qTableFile != None and self.episodesSoFar == self.numTraining:
+            self.qValues.save(self.qTableFile)
+            print 'Saved %d states to %s' % (len(self.qValues), self.qTableFile)
 
     def getPolicy(self, state):
         return self.computeActionFromQValues(state)
@@ -151,34 +219,104 @@ class ApproximateQAgent(PacmanQAgent):
        and update.  All other QLearningAgent functions
        should work as is.
     """
-    def __init__(self, extractor='IdentityExtractor', **args):
+    def __init__(self, extractor='IdentityExtractor', hashSize=0, replayWidth=8, **args):
+        """
+        hashSize    - if positive, features are hashed into this many
+                      weights instead of each getting its own
+        replayWidth - most features per vector stored for replay
+        """
         self.featExtractor = util.lookup(extractor, globals())()
+        self.replayWidth = int(replayWidth)
         PacmanQAgent.__init__(self, **args)
-        self.weights = util.Counter()
+        self.featureIndex = FeatureIndex(int(hashSize))
+        self.weights = array.array('d', [0.0] * len(self.featureIndex))
 
     def getWeights(self):
-        return self.weights
+        return self.featureIndex.toCounter(self.weights)
 
     def getQValue(self, state, action):
         """
           Should return Q(state,action) = w * featureVector
           where * is the dotProduct operator
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        indices, values = self.featExtractor.getFeatureVector(state, action, self.featureIndex)
+        return self.dotProduct(indices, values)
+
+    def dotProduct(self, indices, values):
+        weights = self.weights
+        qValue = 0.0
+        for i, value in zip(indices, values):
+            qValue += weights[i] * value
+        return qValue
+
+    def getBestQValue(self, state):
+        actions = self.getLegalActions(state)
+        allFeatures = self.featExtractor.getFeaturesForAllActions(state, actions)
+        bestValue, bestAction = 0.0, None
+        for action in actions:
+            qValue = self.dotProduct(*self.featureIndex.vectorize(allFeatures[action]))
+            if bestAction == None or qValue > bestValue:
+                bestValue, bestAction = qValue, action
+        return bestValue, bestAction
 
     def update(self, state, action, nextState, reward):
         """
            Should update your weights based on transition
         """
-        "*** YOUR CODE HERE ***"
-        util.raiseNotDefined()
+        indices, values = self.featExtractor.getFeatureVector(state, action, self.featureIndex, True)
+        self.growWeights()
+        sample = reward + self.discount * self.computeValueFromQValues(nextState)
+        step = self.alpha * (sample - self.dotProduct(indices, values))
+        weights = self.weights
+        for i, value in zip(indices, values):
+            weights[i] += step * value
+        if self.replay != None and self.alpha > 0:
+            self.remember(state, action, nextState, reward)
+            self.replayMinibatch()
+
+    def growWeights(self):
+        "Adds zero weights for the features registered since the last call"
+        if len(self.weights) < len(self.featureIndex):
+            self.weights.extend([0.0] * (len(self.featureIndex) - len(self.weights)))
+
+    def newReplayBuffer(self, capacity, prioritized):
+        # The features of the transition, then those of each next action
+        numVectors = 1 + len(Actions._directionsAsList)
+        return ReplayBuffer(capacity, prioritized, numVectors, self.replayWidth)
+
+    def remember(self, state, action, nextState, reward):
+        "Stores a transition in the replay buffer by its feature vectors"
+        vectors = [self.featExtractor.getFeatureVector(state, action, self.featureIndex, True)]
+        for nextAction in self.getLegalActions(nextState):
+            vectors.append(self.featExtractor.getFeatureVector(nextState, nextAction, self.featureIndex, True))
+        self.growWeights()
+        nextActions = (1 << (len(vectors) - 1)) - 1
+        self.replay.add(0, 0, reward, 0, nextActions, nextActions == 0, vectors)
+
+    def replayTransition(self, slot, weight):
+        replay = self.replay
+        indices, values = replay.getVector(slot, 0)
+        sample = replay.rewards[slot]
+        if not replay.dones[slot]:
+            sample += self.discount * max([self.dotProduct(*replay.getVector(slot, k + 1))
+                                           for k in bitIndices(replay.nextActions[slot])])
+        error = sample - self.dotProduct(indices, values)
+        step = self.alpha * weight * error
+        weights = self.weights
+        for i, value in zip(indices, values):
+            weights[i] += step * value
+        return error
 
     def final(self, state):
         "Called at the end of each game."
         # call the super-class final method
         PacmanQAgent.final(self, state)
 
+        cache = getattr(self.featExtractor, 'cache', None)
+        if cache != None and self.episodesSoFar % 100 == 0:
+            print '\tFeature cache hit rate: %.2f (%d hits, %d misses)' % (
+                    cache.getHitRate(), cache.hits, cache.misses)
+
         # did we finish training?
         if self.episodesSoFar == self.numTraining:
             # you might want to print your weights here for debugging
@@ -35,6 +35,7 @@ class ValueIterationTest(testClasses.TestCase):
         self.discount = float(testDict['discount'])
         self.grid = gridworld.Gridworld(parseGrid(testDict['grid']))
         iterations = int(testDict['valueIterations'])
+        self.agentName = testDict.get('agent', 'ValueIterationAgent')
         if 'noise' in testDict: self.grid.setNoise(float(testDict['noise']))
         if 'livingReward' in testDict: self.grid.setLivingReward(float(testDict['livingReward']))
         maxPreIterations = 10
@@ -120,7 +121,8 @@ class ValueIterationTest(testClasses.TestCase):
         return True
 
     def runAgent(self, moduleDict, numIterations):
-        agent = moduleDict['valueIterationAgents'].ValueIterationAgent(self.grid, discount=self.discount, iterations=numIterations)
+        agentClass = getattr(moduleDict['valueIterationAgents'], self.agentName)
+        agent = agentClass(self.grid, discount=self.discount, iterations=numIterations)
         states = self.grid.getStates()
         actions = list(reduce(lambda a, b: set(a).union(b), [self.grid.getPossibleActions(state) for state in states]))
         values = {}
@@ -13,6 +13,7 @@
 
 
 import mdp, util
+from mdp import CompiledMDP
 
 from learningAgents import ValueEstimationAgent
 
@@ -83,3 +84,107 @@ class ValueIterationAgent(ValueEstimationAgent):
 
     def getQValue(self, state, action):
         return self.computeQValueFromValues(state, action)
+
+
+class CompiledValueIterationAgent(ValueEstimationAgent):
+    """
+        Runs the same value iteration as a ValueIterationAgent,
+        but on the arrays of an mdp.CompiledMDP, which makes it
+        practical for mdps with tens of thousands of states.
+
+        Besides the number of iterations, a tolerance can be
+        given: iteration stops early once no value changes by
+        more than it between two sweeps.
+    """
+    def __init__(self, mdp, discount = 0.9, iterations = 100, tolerance = 0.0):
+        self.mdp = mdp
+        self.discount = discount
+        self.iterations = iterations
+        self.compiled = CompiledMDP(mdp)
+        self.vector, self.sweeps = self.compiled.valueIteration(discount, iterations, tolerance)
+        self.backups = self.sweeps * self.compiled.numActiveStates()
+        self.values = self.compiled.toCounter(self.vector)
+
+    def getValue(self, state):
+        return self.values[state]
+
+    def computeQValueFromValues(self, state, action):
+        return self.compiled.getQValue(self.vector, self.discount, state, action)
+
+    def computeActionFromValues(self, state):
+        return self.compiled.getPolicy(self.vector, self.discount, state)
+
+    def getPolicy(self, state):
+        return self.computeActionFromValues(state)
+
+    def getAction(self, state):
+        "Returns the policy at the state (no exploration)."
+        return self.computeActionFromValues(state)
+
+    def getQValue(self, state, action):
+        return self.computeQValueFromValues(state, action)
+
+
+class AsynchronousValueIterationAgent(CompiledValueIterationAgent):
+    """
+        Runs value iteration in place, backing up one state per
+        iteration and cycling through the states in order, so each
+        backup already sees the values written before it.
+
+        Here iterations counts single-state backups, not sweeps.
+        Iteration also stops once a whole cycle changes no value by
+        more than tolerance.
+    """
+    def __init__(self, mdp, discount = 0.9, iterations = 1000, tolerance = 0.0):
+        self.mdp = mdp
+        self.discount = discount
+        self.iterations = iterations
+        self.compiled = CompiledMDP(mdp)
+        self.vector, self.backups = self.compiled.cyclicValueIteration(discount, iterations, tolerance)
+        self.values = self.compiled.toCounter(self.vector)
+
+
+class PrioritizedSweepingValueIterationAgent(CompiledValueIterationAgent):
+    """
+        Runs prioritized sweeping: the state with the largest Bellman
+        error is backed up first, and after each backup only the
+        predecessors of that state are checked again.  States whose
+        error is at most theta are never backed up.
+
+        Here iterations counts single-state backups, not sweeps.
+    """
+    def __init__(self, mdp, discount = 0.9, iterations = 100, theta = 1e-5):
+        self.mdp = mdp
+        self.discount = discount
+        self.iterations = iterations
+        self.theta = theta
+        self.compiled = CompiledMDP(mdp)
+        self.vector, self.backups = self.compiled.prioritizedSweeping(discount, iterations, theta)
+        self.values = self.compiled.toCounter(self.vector)
+
+
+class PolicyIterationAgent(CompiledValueIterationAgent):
+    """
+        Runs policy iteration: the current policy is evaluated, then
+        made greedy with respect to its values, until it stops
+        changing or iterations improvements have been made.
+
+        By default each policy is evaluated exactly with a sparse
+        linear solve; given sweeps, it is instead evaluated with that
+        many in-place sweeps (modified policy iteration).
+    """
+    def __init__(self, mdp, discount = 0.9, iterations = 100, sweeps = None):
+        self.mdp = mdp
+        self.discount = discount
+        self.iterations = iterations
+        self.sweeps = sweeps
+        self.compiled = CompiledMDP(mdp)
+        self.vector, self.policy, self.improvements = self.compiled.policyIteration(discount, iterations, sweeps)
+        self.values = self.compiled.toCounter(self.vector)
+
+    def computeActionFromValues(self, state):
+        "The action of the policy found; None where there are no actions"
+        row = self.policy[self.compiled.stateIndex[state]]
+        if row < 0:
+            return None
+        return self.compiled.rowActions[row]